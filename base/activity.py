@@ -0,0 +1,111 @@
+"""Hourly per-room activity rollups (``RoomActivity``).
+
+Write paths call ``record_message()`` and ``record_members()``. Each is one
+UPDATE of the room's row for the current hour; the first event of a room in an
+hour also inserts that row. ``room_stats()`` reads rollup rows inside the
+requested window only, so the dashboard costs the same however long the
+message history grows.
+
+``compact()`` is the periodic job (``manage.py rollup_activity``): it rebuilds
+message counts of finished hours from ``ChatMessage`` (backfill, or repair after
+a failed write) and prunes buckets older than ``ACTIVITY_RETENTION_DAYS``.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Max
+from django.db.models.functions import Greatest, TruncHour
+from django.utils import timezone
+
+from .models import ChatMessage, Room, RoomActivity, RoomMember
+
+
+def bucket_of(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _active_members(room_id):
+    return RoomMember.objects.filter(room_id=room_id, is_active=True).count()
+
+
+def _bump(room_id, moment, **updates):
+    """Apply ``updates`` to the room's bucket for ``moment``, creating it first if needed"""
+    rows = RoomActivity.objects.filter(room_id=room_id, bucket=bucket_of(moment))
+    if rows.update(**updates):
+        return
+    try:
+        with transaction.atomic():
+            RoomActivity.objects.create(
+                room_id=room_id, bucket=bucket_of(moment), peak_members=_active_members(room_id)
+            )
+    except IntegrityError:
+        pass  # Another worker created it first
+    rows.update(**updates)
+
+
+def record_message(room_id, moment=None):
+    moment = moment or timezone.now()
+    _bump(room_id, moment, message_count=F('message_count') + 1, last_activity_at=moment)
+
+
+def record_members(room_id, moment=None):
+    """Call after a member joins or leaves; raises the hour's peak if needed"""
+    moment = moment or timezone.now()
+    _bump(room_id, moment, peak_members=Greatest(F('peak_members'), _active_members(room_id)), last_activity_at=moment)
+
+
+def room_stats(room_ids=None, hours=24):
+    """{room_id: {'messages', 'messages_per_hour', 'peak_members', 'last_activity_at'}} over the last ``hours``"""
+    since = bucket_of(timezone.now()) - timedelta(hours=hours - 1)
+    rows = RoomActivity.objects.filter(bucket__gte=since)
+    if room_ids is not None:
+        rows = rows.filter(room_id__in=room_ids)
+    # At most rooms x hours rows from the bucket index; summed here so the
+    # database never has to group them.
+    stats = {}
+    for room_id, count, peak, last in rows.values_list('room_id', 'message_count', 'peak_members', 'last_activity_at'):
+        room = stats.setdefault(room_id, {'messages': 0, 'peak_members': 0, 'last_activity_at': None})
+        room['messages'] += count
+        room['peak_members'] = max(room['peak_members'], peak)
+        if last and (room['last_activity_at'] is None or last > room['last_activity_at']):
+            room['last_activity_at'] = last
+    for room in stats.values():
+        room['messages_per_hour'] = round(room['messages'] / hours, 2)
+    return stats
+
+
+def room_buckets(room_id, hours=24):
+    """Hour-by-hour rows for one room, oldest first"""
+    since = bucket_of(timezone.now()) - timedelta(hours=hours - 1)
+    return list(
+        RoomActivity.objects.filter(room_id=room_id, bucket__gte=since)
+        .order_by('bucket').values('bucket', 'message_count', 'peak_members')
+    )
+
+
+def compact(hours=24 * 7, retention_days=None):
+    """Rebuild message counts for finished hours in the last ``hours``, prune old buckets
+
+    Returns (buckets written, buckets pruned). Peaks can't be reconstructed
+    from history and are left as recorded.
+    """
+    retention_days = retention_days or getattr(settings, 'ACTIVITY_RETENTION_DAYS', 90)
+    current = bucket_of(timezone.now())
+    since = current - timedelta(hours=hours)
+    written = 0
+    for room_id in list(Room.objects.order_by().values_list('id', flat=True)):
+        # One index range per room on (room, created_at)
+        hourly = ChatMessage.objects.filter(
+            room_id=room_id, created_at__gte=since, created_at__lt=current
+        ).annotate(hour=TruncHour('created_at', tzinfo=timezone.utc)).values('hour').annotate(
+            count=Count('id'), last=Max('created_at')
+        ).order_by()
+        for row in hourly:
+            RoomActivity.objects.update_or_create(
+                room_id=room_id, bucket=row['hour'],
+                defaults={'message_count': row['count'], 'last_activity_at': row['last']},
+            )
+            written += 1
+    pruned, _ = RoomActivity.objects.filter(bucket__lt=current - timedelta(days=retention_days)).delete()
+    return written, pruned
@@ -1,8 +1,229 @@
 from django.contrib import admin
+from django.contrib.admin.utils import model_ngettext
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.contrib.auth import get_permission_codename
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.functional import cached_property
 
 # Register your models here.
 
-from .models import RoomMember
+from . import reaper
+from .models import ChatMessage, Room, RoomMember
 
+# Unfiltered tables at least this big use the planner's row estimate (PostgreSQL).
+ESTIMATE_FROM = 100000
+# Filtered changelists stop counting here and show "~COUNT_CAP".
+COUNT_CAP = 10000
+# Changelist cursor: show rows with a primary key below this value.
+KEYSET_VAR = 'after'
 
-admin.site.register(RoomMember)
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that never runs a full COUNT(*) on a large table"""
+
+    approximate = False
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if not queryset.query.where and connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples FROM pg_class WHERE oid = %s::regclass', [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] >= ESTIMATE_FROM:
+                self.approximate = True
+                return int(row[0])
+        count = queryset.order_by()[:COUNT_CAP + 1].count()
+        if count > COUNT_CAP:
+            self.approximate = True
+            return COUNT_CAP
+        return count
+
+
+class KeysetChangeList(ChangeList):
+    """Newest-first pages walked by primary key (?after=<pk>) instead of OFFSET
+
+    Only used with the default ordering; sorting by a column header falls back
+    to page numbers (bounded by COUNT_CAP on filtered lists).
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        try:
+            self.keyset_after = int(request.GET[KEYSET_VAR])
+        except (KeyError, ValueError):
+            self.keyset_after = None
+        self.keyset_next = None
+        super().__init__(request, *args, **kwargs)
+
+    def get_filters_params(self, params=None):
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    @property
+    def keyset(self):
+        return ORDER_VAR not in self.params
+
+    def get_results(self, request):
+        if not self.keyset:
+            return super().get_results(request)
+
+        queryset = self.queryset.order_by('-pk')
+        if self.keyset_after is not None:
+            queryset = queryset.filter(pk__lt=self.keyset_after)
+        rows = list(queryset[:self.list_per_page + 1])
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.keyset_next = rows[-1].pk
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.full_result_count = None
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = self.keyset_next is not None or self.keyset_after is not None
+
+    def keyset_first_url(self):
+        return self.get_query_string(remove=[KEYSET_VAR, PAGE_VAR])
+
+    def keyset_next_url(self):
+        return self.get_query_string({KEYSET_VAR: self.keyset_next}, [PAGE_VAR])
+
+
+class ScalableAdmin(admin.ModelAdmin):
+    """Changelist, search and delete behaviour that holds up on large tables"""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 100
+    ordering = ('-id',)
+    # Search terms are matched exactly, so every field here needs an index.
+    search_fields = ()
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+    def get_search_results(self, request, queryset, search_term):
+        """Exact match on indexed fields (the default icontains can't use an index)"""
+        term = search_term.strip()
+        if not term:
+            return queryset, False
+        query = Q()
+        for name in self.search_fields:
+            field = name.split('__')[-1]
+            if field in ('id', 'pk') and not term.isdigit():
+                continue
+            query |= Q(**{name: term})
+        return (queryset.filter(query) if query else queryset.none()), False
+
+    def get_deleted_objects(self, objs, request):
+        """Summarise the deletion instead of collecting every row to list it"""
+        count = len(objs) if isinstance(objs, list) else objs.count()
+        opts = self.model._meta
+        perms_needed = set()
+        if not request.user.has_perm(f'{opts.app_label}.{get_permission_codename("delete", opts)}'):
+            perms_needed.add(opts.verbose_name)
+        return [f'{count} {model_ngettext(opts, count)}'], {opts.verbose_name_plural: count}, perms_needed, []
+
+
+def _rooms_changed(queryset):
+    for room_id in set(queryset.order_by().values_list('room_id', flat=True).distinct()):
+        reaper.forget_room(room_id)
+
+
+@admin.register(Room)
+class RoomAdmin(ScalableAdmin):
+    list_display = ('id', 'name', 'room_code', 'is_active', 'max_members', 'created_at', 'updated_at')
+    list_filter = ('is_active',)
+    search_fields = ('id', 'room_code', 'name', 'share_link_id')
+    readonly_fields = ('deactivated_at', 'delete_requested_at')
+    actions = ['deactivate_rooms']
+
+    def save_model(self, request, obj, form, change):
+        if 'is_active' in form.changed_data:
+            # Switched by hand, so no longer the reaper's to purge
+            obj.deactivated_at = obj.delete_requested_at = None
+        super().save_model(request, obj, form, change)
+
+    def get_deleted_objects(self, objs, request):
+        deleted, model_count, perms_needed, protected = super().get_deleted_objects(objs, request)
+        ids = [obj.pk for obj in objs]
+        for model in (ChatMessage, RoomMember):
+            opts = model._meta
+            model_count[opts.verbose_name_plural] = model._base_manager.filter(room_id__in=ids).count()
+            if not request.user.has_perm(f'{opts.app_label}.{get_permission_codename("delete", opts)}'):
+                perms_needed.add(opts.verbose_name)
+        return deleted, model_count, perms_needed, protected
+
+    # Admin deletes run in one transaction, so the chunked purge is left to the
+    # reaper; the room is hidden right away.
+    def delete_model(self, request, obj):
+        reaper.request_purge([obj.pk])
+        self.message_user(request, 'Its messages and members are removed by the next reap_rooms pass.')
+
+    def delete_queryset(self, request, queryset):
+        reaper.request_purge(list(queryset.values_list('pk', flat=True)))
+        self.message_user(request, 'Their messages and members are removed by the next reap_rooms pass.')
+
+    @admin.action(description='Deactivate selected rooms', permissions=['change'])
+    def deactivate_rooms(self, request, queryset):
+        ids = list(queryset.values_list('pk', flat=True))
+        # No deactivated_at: rooms deactivated here are never purged by the reaper.
+        updated = Room.objects.filter(pk__in=ids).update(is_active=False, deactivated_at=None, updated_at=timezone.now())
+        for room_id in ids:
+            reaper.forget_room(room_id)
+        self.message_user(request, f'Deactivated {updated} rooms.')
+
+
+@admin.register(RoomMember)
+class RoomMemberAdmin(ScalableAdmin):
+    list_display = ('id', 'name', 'uid', 'room', 'is_active', 'joined_at', 'last_read_message_id')
+    list_select_related = ('room',)
+    list_filter = ('is_active',)
+    raw_id_fields = ('room',)
+    search_fields = ('id', 'uid', 'room__room_code')
+    actions = ['deactivate_members', 'activate_members']
+
+    def delete_queryset(self, request, queryset):
+        queryset._raw_delete(queryset.db)
+
+    @admin.action(description='Deactivate selected members', permissions=['change'])
+    def deactivate_members(self, request, queryset):
+        updated = queryset.update(is_active=False)
+        self.message_user(request, f'Deactivated {updated} members.')
+
+    @admin.action(description='Reactivate selected members', permissions=['change'])
+    def activate_members(self, request, queryset):
+        updated = queryset.update(is_active=True)
+        self.message_user(request, f'Reactivated {updated} members.')
+
+
+@admin.register(ChatMessage)
+class ChatMessageAdmin(ScalableAdmin):
+    list_display = ('id', 'room', 'sender_name', 'sender_uid', 'preview', 'created_at', 'is_edited')
+    list_select_related = ('room',)
+    raw_id_fields = ('room',)
+    search_fields = ('id', 'room__room_code')
+    actions = ['redact_messages']
+
+    REDACTED = '[removed by a moderator]'
+
+    @admin.display(description='Message')
+    def preview(self, obj):
+        return obj.message[:80]
+
+    def delete_queryset(self, request, queryset):
+        _rooms_changed(queryset)
+        queryset._raw_delete(queryset.db)
+
+    @admin.action(description='Redact selected messages', permissions=['change'])
+    def redact_messages(self, request, queryset):
+        _rooms_changed(queryset)
+        updated = queryset.update(message=self.REDACTED, is_edited=True, edited_at=timezone.now())
+        self.message_user(request, f'Redacted {updated} messages.')
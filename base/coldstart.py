@@ -0,0 +1,78 @@
+"""Cold-start measurement for the WSGI entry points.
+
+Each run starts a fresh interpreter with ``-X importtime``, imports the entry
+module (which runs ``django.setup()``) and resolves one URL, which imports the
+URLconf and views exactly like a serverless function's first request does.
+Used by ``manage.py coldstart`` and the startup regression tests.
+"""
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+
+# Modules that must stay out of a cold start; views import them on demand.
+LAZY_MODULES = (
+    'agora_token_builder',
+    'base.provisioning',
+    'concurrent.futures.process',
+)
+
+# What mychat.settings_api leaves out. Wall-clock time is too noisy to test
+# (either entry point measures 170-270 ms run to run), so the tests check
+# these stay unimported instead.
+SLIM_EXCLUDED = (
+    'django.contrib.admin',
+    'django.contrib.messages',
+    'django.contrib.sessions',
+    'django.contrib.staticfiles',
+    'django.middleware.clickjacking',
+)
+
+SCRIPT = '''
+import json, sys, time
+start = time.perf_counter()
+import {module}
+from django.urls import resolve
+resolve({path!r})
+print(json.dumps({{'ms': (time.perf_counter() - start) * 1000, 'modules': sorted(sys.modules)}}))
+'''
+
+
+def parse_importtime(stderr):
+    """-X importtime lines -> [(module, self_us, cumulative_us)]"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line.split(':', 1)[1].split('|')
+        rows.append((name.strip(), int(self_us), int(cumulative_us)))
+    return rows
+
+
+def run_once(module, path):
+    env = dict(os.environ)
+    # The entry module picks its own settings profile with setdefault().
+    env.pop('DJANGO_SETTINGS_MODULE', None)
+    proc = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', SCRIPT.format(module=module, path=path)],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    result['imports'] = parse_importtime(proc.stderr)
+    return result
+
+
+def measure(module='mychat.wsgi', path='/chat/messages/', runs=3):
+    """Best of ``runs`` cold starts: {'ms', 'modules', 'imports'}"""
+    return min((run_once(module, path) for _ in range(runs)), key=lambda r: r['ms'])
+
+
+def by_package(imports):
+    """Sum self time per top-level package, largest first"""
+    totals = defaultdict(int)
+    for name, self_us, _ in imports:
+        totals[name.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: -item[1])
@@ -0,0 +1,333 @@
+"""Room-scoped publish/subscribe between workers.
+
+Views publish events after a write::
+
+    events.publish(room.id, events.MESSAGE_CREATED, id=chat_msg.id)
+
+Events published inside a transaction are held until it commits. Bursts are
+batched: one sender thread per process waits ``BATCH_WINDOW_MS`` after the
+first event and publishes everything queued by then as one batch (or sooner
+once ``BATCH_SIZE`` is reached). An event too large for one payload goes out
+with its data cut down to the id, which peers treat as an invalidation. Subscribers are called with a list of events that
+originated in *other* processes; the publishing process has already updated
+its own state. When a transport may have dropped events (the ``postgres``
+listener reconnecting), subscribers get a single ``bus.gap`` event and should
+discard whatever they derived from earlier events.
+
+Backends (``EVENT_BUS['BACKEND']``):
+
+- ``memory``: delivers between buses in the same interpreter only. The
+  default for a single worker, and what the tests use.
+- ``socket``: Unix datagram sockets in ``SOCKET_DIR``, one per process. For
+  several workers on one host.
+- ``postgres``: ``LISTEN``/``NOTIFY`` on ``CHANNEL``, for workers and
+  serverless instances that share the database.
+"""
+import json
+import logging
+import os
+import select
+import socket
+import threading
+import time
+import uuid
+import weakref
+
+from django.conf import settings
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+MESSAGE_CREATED = 'message.created'
+MESSAGE_EDITED = 'message.edited'
+MESSAGE_DELETED = 'message.deleted'
+MEMBER_JOINED = 'member.joined'
+MEMBER_LEFT = 'member.left'
+ROOM_CHANGED = 'room.changed'
+BUS_GAP = 'bus.gap'  # Events may have been missed; no room_id
+
+# pg_notify payloads must stay under 8000 bytes. Measured on the encoded
+# payload: json.dumps escapes non-ASCII, so one CJK character takes 6 bytes.
+MAX_PAYLOAD = 7000
+
+
+def _config():
+    return {
+        'BACKEND': 'memory',
+        'SOCKET_DIR': '/tmp/streambeat-events',
+        'CHANNEL': 'streambeat_events',
+        'BATCH_WINDOW_MS': 10,
+        'BATCH_SIZE': 200,
+        **getattr(settings, 'EVENT_BUS', {}),
+    }
+
+
+def _size(events):
+    return len(json.dumps(events).encode())
+
+
+def _fit(event):
+    """``event``, or an invalidate-only copy (data cut to the id) if it would not fit alone"""
+    if _size([event]) <= MAX_PAYLOAD:
+        return event
+    data = {key: event['data'][key] for key in ('id',) if key in event['data']}
+    return {**event, 'data': data}
+
+
+def _chunks(events):
+    """Split a batch into JSON payloads that fit one datagram / NOTIFY"""
+    batch = []
+    for event in map(_fit, events):
+        batch.append(event)
+        if len(batch) > 1 and _size(batch) > MAX_PAYLOAD:
+            yield json.dumps(batch[:-1])
+            batch = [event]
+    if batch:
+        yield json.dumps(batch)
+
+
+# ==================== BACKENDS ====================
+
+_memory_peers = weakref.WeakSet()
+
+
+class MemoryBackend:
+    shared = False  # Same interpreter only
+
+    def __init__(self, bus, config):
+        self.bus = bus
+
+    def start(self):
+        _memory_peers.add(self.bus)
+
+    def send(self, events):
+        for peer in list(_memory_peers):
+            peer.dispatch(events)
+
+
+class SocketBackend:
+    shared = True
+
+    def __init__(self, bus, config):
+        self.bus = bus
+        self.dir = config['SOCKET_DIR']
+        self.path = None
+        self.sock = None
+
+    def start(self):
+        os.makedirs(self.dir, exist_ok=True)
+        self.path = os.path.join(self.dir, f'{self.bus.origin}.sock')
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self.sock.bind(self.path)
+        threading.Thread(target=self.listen, name='event-bus-socket', daemon=True).start()
+
+    def listen(self):
+        while True:
+            try:
+                data = self.sock.recv(65536)
+                self.bus.dispatch(json.loads(data))
+            except Exception:
+                logger.exception('event bus: bad datagram')
+
+    def send(self, events):
+        payloads = list(_chunks(events))
+        out = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            for name in os.listdir(self.dir):
+                peer = os.path.join(self.dir, name)
+                if peer == self.path or not name.endswith('.sock'):
+                    continue
+                try:
+                    for payload in payloads:
+                        out.sendto(payload.encode(), peer)
+                except (ConnectionRefusedError, FileNotFoundError):
+                    # The worker that owned this socket is gone.
+                    try:
+                        os.remove(peer)
+                    except OSError:
+                        pass
+        finally:
+            out.close()
+
+
+class PostgresBackend:
+    retry_delay = 1  # Seconds between LISTEN reconnects
+
+    def __init__(self, bus, config):
+        self.bus = bus
+        self.channel = config['CHANNEL']
+        # Only while LISTEN is up; until then readers check the DB themselves.
+        self.shared = False
+        self.conn = None  # NOTIFY connection, kept open between batches
+        self.send_lock = threading.Lock()
+
+    def start(self):
+        threading.Thread(target=self.listen, name='event-bus-pg', daemon=True).start()
+
+    def listen(self):
+        import psycopg2
+
+        while True:
+            conn = None
+            try:
+                conn = psycopg2.connect(**connection.get_connection_params())
+                conn.autocommit = True
+                with conn.cursor() as cursor:
+                    cursor.execute(f'LISTEN "{self.channel}"')
+                # Anything sent before this LISTEN was missed.
+                self.bus.gap()
+                self.shared = True
+                while True:
+                    if select.select([conn], [], [], 30) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        self.bus.dispatch(json.loads(conn.notifies.pop(0).payload))
+            except Exception:
+                self.shared = False
+                logger.exception('event bus: LISTEN connection lost, reconnecting')
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                threading.Event().wait(self.retry_delay)
+
+    def send(self, events):
+        import psycopg2
+
+        with self.send_lock:
+            try:
+                if self.conn is None or self.conn.closed:
+                    self.conn = psycopg2.connect(**connection.get_connection_params())
+                    self.conn.autocommit = True
+                with self.conn.cursor() as cursor:
+                    for payload in _chunks(events):
+                        cursor.execute('SELECT pg_notify(%s, %s)', [self.channel, payload])
+            except psycopg2.Error:
+                if self.conn is not None:
+                    self.conn.close()
+                    self.conn = None  # Reconnect on the next batch
+                raise
+
+
+BACKENDS = {
+    'memory': MemoryBackend,
+    'socket': SocketBackend,
+    'postgres': PostgresBackend,
+}
+
+
+# ==================== BUS ====================
+
+class EventBus:
+    def __init__(self, config):
+        self.pid = os.getpid()
+        self.origin = f'{self.pid}-{uuid.uuid4().hex[:8]}'
+        self.window = config['BATCH_WINDOW_MS'] / 1000
+        self.batch_size = config['BATCH_SIZE']
+        self.backend = BACKENDS[config['BACKEND']](self, config)
+        self.subscribers = []
+        self.pending = []
+        self.ready = threading.Condition()
+        self.sender = None
+        self.backend.start()
+
+    def subscribe(self, handler):
+        self.subscribers.append(handler)
+
+    def enqueue(self, event):
+        with self.ready:
+            self.pending.append(event)
+            if self.window:
+                if self.sender is None:
+                    self.sender = threading.Thread(target=self.run, name='event-bus-sender', daemon=True)
+                    self.sender.start()
+                self.ready.notify()
+                return
+        self.flush()
+
+    def run(self):
+        """Sender thread: one batch per window, so backends publish from one long-lived thread"""
+        while True:
+            with self.ready:
+                while not self.pending:
+                    self.ready.wait()
+                deadline = time.monotonic() + self.window
+                while len(self.pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.ready.wait(remaining)
+            self.flush()
+
+    def flush(self):
+        with self.ready:
+            events, self.pending = self.pending, []
+        if events:
+            try:
+                self.backend.send(events)
+            except Exception:
+                logger.exception('event bus: failed to publish %d events', len(events))
+
+    def gap(self):
+        """Tell subscribers that events from other processes may have been lost"""
+        self.dispatch([{'room_id': None, 'type': BUS_GAP, 'data': {}, 'origin': None}])
+
+    def dispatch(self, events):
+        events = [e for e in events if e['origin'] != self.origin]
+        if not events:
+            return
+        for handler in self.subscribers:
+            try:
+                handler(events)
+            except Exception:
+                logger.exception('event bus: subscriber %r failed', handler)
+
+
+_bus = None
+_bus_lock = threading.Lock()
+_subscribers = []
+
+
+def get_bus():
+    """The bus for this process, (re)started after a fork"""
+    global _bus
+    if _bus is None or _bus.pid != os.getpid():
+        with _bus_lock:
+            if _bus is None or _bus.pid != os.getpid():
+                bus = EventBus(_config())
+                for handler in _subscribers:
+                    bus.subscribe(handler)
+                _bus = bus
+    return _bus
+
+
+def subscribe(handler):
+    """Register ``handler(events)``; kept across forks and bus restarts"""
+    _subscribers.append(handler)
+    if _bus is not None:
+        _bus.subscribe(handler)
+
+
+def is_shared():
+    """True if events reach other processes right now (socket, or postgres while listening)"""
+    return get_bus().backend.shared
+
+
+def publish(room_id, kind, **data):
+    """Publish a room event once the current transaction (if any) commits"""
+    bus = get_bus()
+    event = {'room_id': room_id, 'type': kind, 'data': data, 'origin': bus.origin}
+    transaction.on_commit(lambda: bus.enqueue(event))
+
+
+class EventBusMiddleware:
+    """Starts this worker's listener on its first request (after any fork)"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        get_bus()
+        return self.get_response(request)
@@ -0,0 +1,76 @@
+"""Fast lane for high-frequency JSON API routes.
+
+Requests whose path starts with one of ``settings.FAST_LANE_PREFIXES`` skip
+session, auth, messages, CSRF and clickjacking middleware entirely: the
+``@csrf_exempt`` JSON views never touch ``request.session``, ``request.user``
+or messages. A view under a fast-lane prefix that does need them opts back in
+with ``@full_stack``. Use the ``FastLane*`` classes in ``MIDDLEWARE`` in place
+of Django's.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.contrib.messages.middleware import MessageMiddleware
+from django.contrib.sessions.middleware import SessionMiddleware
+from django.middleware.clickjacking import XFrameOptionsMiddleware
+from django.middleware.csrf import CsrfViewMiddleware
+from django.urls import Resolver404, resolve
+
+
+def full_stack(view_func):
+    """Opt a view under a FAST_LANE_PREFIXES path back into the full middleware stack"""
+    view_func.full_stack = True
+    return view_func
+
+
+@lru_cache(maxsize=1024)
+def _opted_out(urlconf, path):
+    """True if ``path`` routes to a @full_stack view (resolved once per path)"""
+    try:
+        return getattr(resolve(path, urlconf).func, 'full_stack', False)
+    except Resolver404:
+        return False
+
+
+def in_fast_lane(request):
+    """True if ``request`` should skip session/auth/messages/CSRF/clickjacking work"""
+    lane = getattr(request, '_fast_lane', None)
+    if lane is None:
+        lane = request.path_info.startswith(tuple(getattr(settings, 'FAST_LANE_PREFIXES', ())))
+        if lane:
+            lane = not _opted_out(settings.ROOT_URLCONF, request.path_info)
+        request._fast_lane = lane
+    return lane
+
+
+class FastLaneMixin:
+    """Pass fast-lane requests straight through to the next middleware"""
+
+    def __call__(self, request):
+        if in_fast_lane(request):
+            return self.get_response(request)
+        return super().__call__(request)
+
+
+class FastLaneSessionMiddleware(FastLaneMixin, SessionMiddleware):
+    pass
+
+
+class FastLaneCsrfViewMiddleware(FastLaneMixin, CsrfViewMiddleware):
+    def process_view(self, request, callback, callback_args, callback_kwargs):
+        if in_fast_lane(request):
+            return None
+        return super().process_view(request, callback, callback_args, callback_kwargs)
+
+
+class FastLaneAuthenticationMiddleware(FastLaneMixin, AuthenticationMiddleware):
+    pass
+
+
+class FastLaneMessageMiddleware(FastLaneMixin, MessageMiddleware):
+    pass
+
+
+class FastLaneXFrameOptionsMiddleware(FastLaneMixin, XFrameOptionsMiddleware):
+    pass
@@ -0,0 +1,224 @@
+import json
+import random
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings, setup_test_environment, teardown_test_environment
+
+from base.message_buffer import get_buffer
+from base.models import ChatMessage, Room
+from base.throttling import CacheBackend, MemoryBackend
+from base.wire import unpack_messages
+
+
+@contextmanager
+def seeded_room(messages=1000, senders=8):
+    """Create a throwaway room with ``messages`` rows; everything is rolled back"""
+    with transaction.atomic():
+        room = Room.objects.create(
+            name=f'bench-{random.getrandbits(32):08x}',
+            room_code=f'B{random.getrandbits(24):06X}'[:10],
+            description='Benchmark room',
+        )
+        people = [(f'User {i}', f'uid-{random.getrandbits(40):010x}') for i in range(senders)]
+        ChatMessage.objects.bulk_create([
+            ChatMessage(
+                room=room,
+                sender_name=people[i % senders][0],
+                sender_uid=people[i % senders][1],
+                message=f'Message number {i} in the benchmark room',
+            )
+            for i in range(messages)
+        ], batch_size=1000)
+        try:
+            yield room
+        finally:
+            transaction.set_rollback(True)
+
+
+def timed(func, repeat):
+    """Best-of-``repeat`` wall time of ``func()`` in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best * 1000
+
+
+def bench_chat_payload(command, client, options):
+    """Row vs compact format for GET /chat/messages/"""
+    with seeded_room(options['messages'], options['senders']) as room:
+        url = f'/chat/messages/?room_id={room.id}'
+        rows = client.get(url).content
+        compact = client.get(url + '&format=compact').content
+
+        decoded = unpack_messages(json.loads(compact)['messages'])
+        if len(decoded) != len(json.loads(rows)['messages']):
+            raise CommandError('compact payload does not round-trip')
+        rows_ms = timed(lambda: json.loads(rows), options['repeat'])
+        compact_ms = timed(lambda: json.loads(compact), options['repeat'])
+
+    command.report('chat-payload', [
+        ('messages', options['messages'], ''),
+        ('senders', options['senders'], ''),
+        ('rows bytes', len(rows), ''),
+        ('compact bytes', len(compact), f'{len(rows) / len(compact):.2f}x smaller'),
+        ('rows parse ms', f'{rows_ms:.2f}', ''),
+        ('compact parse ms', f'{compact_ms:.2f}', f'{rows_ms / compact_ms:.2f}x'),
+    ])
+
+
+def bench_wire(command, client, options):
+    """Bytes on the wire per encoding, and whether a repeat GET becomes a 304"""
+    encodings = ['identity', 'gzip', 'br']
+    with seeded_room(options['messages'], options['senders']) as room:
+        urls = [
+            '/manage-users/',
+            '/manage-rooms/',
+            f'/chat/room/{room.id}/',
+            '/rooms/',
+            f'/chat/messages/?room_id={room.id}',
+            f'/chat/messages/?room_id={room.id}&format=compact',
+        ]
+        rows = []
+        for url in urls:
+            sizes = []
+            for encoding in encodings:
+                response = client.get(url, HTTP_ACCEPT_ENCODING=encoding)
+                served = response.get('Content-Encoding', 'identity')
+                sizes.append(f'{len(response.content)}' + ('' if served == encoding else '*'))
+            etag = response.get('ETag')
+            repeat = client.get(url, HTTP_ACCEPT_ENCODING='br, gzip', HTTP_IF_NONE_MATCH=etag or '')
+            rows.append((url, ' / '.join(sizes), f'repeat -> {repeat.status_code}'))
+
+    command.report('wire (identity / gzip / br bytes, * = not applied)', rows)
+
+
+def bench_ratelimit(command, client, options):
+    """Cost of a single token-bucket check per backend"""
+    n = 20000
+    rows = []
+    for label, backend in [('memory', MemoryBackend()), ('cache (default)', CacheBackend())]:
+        keys = [f'rl:bench:{i % 500}' for i in range(n)]
+
+        def run():
+            for k in keys:
+                backend.consume(k, 10, 1.0)
+
+        rows.append((label, f'{timed(run, options["repeat"]) * 1000 / n:.2f} us', 'per check'))
+    command.report('ratelimit', rows)
+
+
+def template_profile(debug):
+    """settings.TEMPLATES as Django configures it with DEBUG on or off
+
+    Without explicit loaders, Django wraps them in the cached loader whenever
+    the engine's ``debug`` is off, so production already compiles each
+    template once per process.
+    """
+    options = {**settings.TEMPLATES[0]['OPTIONS'], 'debug': debug}
+    return [{**settings.TEMPLATES[0], 'OPTIONS': options}]
+
+
+def bench_render(command, client, options):
+    """Repeat-hit page time under the DEBUG (uncached) and production (cached) loaders"""
+    profiles = [template_profile(debug=True), template_profile(debug=False)]
+    with seeded_room(10, 2) as room:
+        urls = ['/', '/manage-users/', '/manage-rooms/', f'/join/{room.share_link_id}/', f'/chat/room/{room.id}/']
+        rows = []
+        for url in urls:
+            times = []
+            for templates in profiles:
+                with override_settings(TEMPLATES=templates):
+                    client.get(url)
+                    times.append(timed(lambda: client.get(url), options['repeat'] * 4))
+            rows.append((url, ' / '.join(f'{t:.2f}' for t in times), f'{times[0] / times[-1]:.1f}x'))
+    command.report('request ms (DEBUG loaders / production loaders)', rows)
+
+
+def bench_fast_lane(command, client, options):
+    """Polling endpoints with and without the middleware fast lane"""
+    with seeded_room(50, 4) as room:
+        room.members.create(name='Bench', uid='bench-uid')
+        urls = [
+            f'/chat/messages/?room_id={room.id}',
+            f'/get_member/?UID=bench-uid&room_code={room.room_code}',
+            f'/rooms/by-code/?code={room.room_code}',
+        ]
+        rows = []
+        for url in urls:
+            results = []
+            for prefixes in [(), settings.FAST_LANE_PREFIXES]:
+                with override_settings(FAST_LANE_PREFIXES=prefixes):
+                    reset_queries()
+                    with CaptureQueriesContext(connection) as queries:
+                        client.get(url)
+                    results.append((timed(lambda: client.get(url), options['repeat'] * 20), len(queries)))
+            (full_ms, full_q), (fast_ms, fast_q) = results
+            rows.append((url.split('?')[0], f'{full_ms:.3f} / {fast_ms:.3f} ms', f'queries {full_q} / {fast_q}'))
+    command.report('fast lane (full stack / fast lane)', rows)
+
+
+def bench_buffer(command, client, options):
+    """First-page reads (?limit=50) from the DB vs the recent-message buffer"""
+    buffer = get_buffer()
+    with seeded_room(options['messages'], options['senders']) as room:
+        url = f'/chat/messages/?room_id={room.id}&limit=50'
+        rows = []
+        for label, warm in [('db', False), ('buffer', True)]:
+            def hit():
+                if not warm:
+                    buffer.invalidate(room.id)
+                client.get(url)
+            hit()
+            reset_queries()
+            with CaptureQueriesContext(connection) as queries:
+                hit()
+            rows.append((label, f'{timed(hit, options["repeat"] * 20):.3f} ms', f'{len(queries)} queries'))
+        rows.append(('hit rate', buffer.stats()['hit_rate'], ''))
+    command.report('buffer', rows)
+
+
+SUITES = {
+    'chat-payload': bench_chat_payload,
+    'wire': bench_wire,
+    'ratelimit': bench_ratelimit,
+    'render': bench_render,
+    'fast-lane': bench_fast_lane,
+    'buffer': bench_buffer,
+}
+
+
+class Command(BaseCommand):
+    help = 'Run a micro-benchmark suite against the local database (data is rolled back)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suite', nargs='*', help=f'Suites to run: {", ".join(SUITES)} (default: all)')
+        parser.add_argument('--messages', type=int, default=2000)
+        parser.add_argument('--senders', type=int, default=8)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def report(self, suite, rows):
+        self.stdout.write(self.style.MIGRATE_HEADING(suite))
+        width = max(len(label) for label, _, _ in rows) + 2
+        for label, value, note in rows:
+            self.stdout.write(f'  {label:<{width}}{value!s:>24}  {note}')
+
+    def handle(self, *args, **options):
+        names = options['suite'] or list(SUITES)
+        unknown = [name for name in names if name not in SUITES]
+        if unknown:
+            raise CommandError(f'Unknown suite(s): {", ".join(unknown)}')
+
+        setup_test_environment()
+        try:
+            client = Client()
+            for name in names:
+                SUITES[name](self, client, options)
+        finally:
+            teardown_test_environment()
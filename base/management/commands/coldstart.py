@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from base import coldstart
+
+
+class Command(BaseCommand):
+    help = 'Report import-time cost of a cold start for each WSGI entry point'
+
+    def add_arguments(self, parser):
+        parser.add_argument('modules', nargs='*', default=['mychat.wsgi', 'mychat.wsgi_api'])
+        parser.add_argument('--path', default='/chat/messages/', help='URL resolved after startup')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--top', type=int, default=15)
+
+    def handle(self, *args, **options):
+        for module in options['modules']:
+            result = coldstart.measure(module, options['path'], options['runs'])
+            self.stdout.write(self.style.MIGRATE_HEADING(module))
+            self.stdout.write(f"  cold start {result['ms']:.1f} ms, {len(result['modules'])} modules")
+
+            self.stdout.write('  by package (self time):')
+            for package, self_us in coldstart.by_package(result['imports'])[:options['top']]:
+                self.stdout.write(f'    {self_us / 1000:8.1f} ms  {package}')
+
+            self.stdout.write('  slowest modules (self time):')
+            slowest = sorted(result['imports'], key=lambda row: -row[1])[:options['top']]
+            for name, self_us, cumulative_us in slowest:
+                self.stdout.write(f'    {self_us / 1000:8.1f} ms  {name}  (cumulative {cumulative_us / 1000:.1f} ms)')
+
+            loaded = [name for name in coldstart.LAZY_MODULES if name in result['modules']]
+            if loaded:
+                self.stdout.write(self.style.WARNING(f"  eagerly imported: {', '.join(loaded)}"))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+from base import queryplans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN every query the JSON views run against a seeded dataset and flag sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=200)
+        parser.add_argument('--members', type=int, default=20, help='Members per room')
+        parser.add_argument('--messages', type=int, default=50, help='Messages per room')
+        parser.add_argument('--plans', action='store_true', help='Print every plan, not just flagged ones')
+        parser.add_argument('--fail', action='store_true', help='Exit non-zero if any sequential scan is found')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        try:
+            results = queryplans.audit(options['rooms'], options['members'], options['messages'])
+        finally:
+            teardown_test_environment()
+
+        flagged = 0
+        for result in results:
+            scans = sum(1 for q in result['queries'] if q['seq_scans'])
+            flagged += scans
+            style = self.style.ERROR if scans else self.style.SUCCESS
+            self.stdout.write(style(
+                f"{result['view']:<28} {result['status']}  {len(result['queries'])} queries, {scans} sequential"
+            ))
+            for query in result['queries']:
+                if not (query['seq_scans'] or options['plans']):
+                    continue
+                if query['seq_scans']:
+                    self.stdout.write(self.style.WARNING(f"    scans {', '.join(query['seq_scans'])}"))
+                self.stdout.write(f"    {query['sql'][:300]}")
+                for line in query['plan']:
+                    self.stdout.write(f'      {line}')
+
+        summary = f'{flagged} sequential scans on {connection.vendor}'
+        if flagged and options['fail']:
+            raise CommandError(summary)
+        self.stdout.write(summary)
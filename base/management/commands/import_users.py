@@ -0,0 +1,42 @@
+import os
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from base import provisioning
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create users from a CSV or NDJSON file (use - for stdin)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'], help='Default: from the file extension')
+        parser.add_argument('--chunk-size', type=int, default=provisioning.DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--workers', type=int, help='Password hashing processes (default: CPU count)')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+        try:
+            if path == '-':
+                text = sys.stdin.read()
+            else:
+                with open(path, encoding='utf-8') as f:
+                    text = f.read()
+            rows = provisioning.parse_rows(text, fmt)
+        except (OSError, ValueError) as e:
+            raise CommandError(e)
+
+        start = time.perf_counter()
+        workers = options['workers'] or os.cpu_count() or 1
+        result = provisioning.import_users(rows, options['chunk_size'], workers)
+        elapsed = time.perf_counter() - start
+
+        for error in result['errors']:
+            self.stderr.write(f"row {error['row']}: {error['message']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Created {result['created']} users, skipped {len(result['skipped'])} existing/duplicate, "
+            f"{len(result['errors'])} invalid rows in {elapsed:.1f}s"
+        ))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from base import profiling
+
+
+class Command(BaseCommand):
+    help = 'Print a signed X-Profile header value that profiles any request while it is valid'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ttl', type=int, default=3600, help='Seconds the token stays valid')
+
+    def handle(self, *args, **options):
+        if options['ttl'] < 1:
+            raise CommandError('--ttl must be at least 1')
+        if not profiling.get_config()['ENABLED']:
+            self.stderr.write('Note: PROFILING_ENABLED is off, so this token has no effect until it is turned on')
+        self.stdout.write(profiling.make_token(options['ttl']))
@@ -0,0 +1,64 @@
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from base import reaper
+
+
+class Command(BaseCommand):
+    help = 'Deactivate idle rooms and purge long-inactive ones in bounded chunks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--idle-days', type=float, default=30, help='Deactivate rooms idle this long')
+        parser.add_argument('--purge-days', type=float, default=7, help='Purge rooms inactive this long')
+        parser.add_argument('--limit', type=int, default=100, help='Rooms per phase per pass')
+        parser.add_argument('--chunk-size', type=int, default=reaper.DEFAULT_CHUNK_SIZE, help='Rows per DELETE')
+        parser.add_argument('--pause', type=float, default=0.0, help='Seconds to sleep between chunks')
+        parser.add_argument('--dry-run', action='store_true', help='Report what would be reaped')
+        parser.add_argument('--loop', action='store_true', help='Keep running, one pass every --interval')
+        parser.add_argument('--interval', type=float, default=3600, help='Seconds between passes with --loop')
+        parser.add_argument('--background', action='store_true', help='Detach and run --loop in the background')
+        parser.add_argument('--log', default='reaper.log', help='Output file for --background')
+
+    def handle(self, *args, **options):
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be at least 1')
+        if options['background']:
+            return self.detach(options)
+
+        while True:
+            self.run_pass(options)
+            if not options['loop']:
+                return
+            time.sleep(options['interval'])
+
+    def run_pass(self, options):
+        start = time.perf_counter()
+        result = reaper.reap(
+            options['idle_days'], options['purge_days'], options['limit'],
+            options['chunk_size'], options['pause'], options['dry_run'],
+        )
+        verb = 'Would reap' if options['dry_run'] else 'Reaped'
+        for room_id, deleted in result['purged'].items():
+            rows = ', '.join(f'{count} {table}' for table, count in deleted.items())
+            self.stdout.write(f'  room {room_id}: {rows or "-"}')
+        self.stdout.write(self.style.SUCCESS(
+            f"{verb}: deactivated {len(result['deactivated'])} rooms, purged {len(result['purged'])} rooms "
+            f"in {time.perf_counter() - start:.1f}s"
+        ))
+
+    def detach(self, options):
+        argv = [
+            sys.executable, str(settings.BASE_DIR / 'manage.py'), 'reap_rooms', '--loop',
+            '--idle-days', str(options['idle_days']), '--purge-days', str(options['purge_days']),
+            '--limit', str(options['limit']), '--chunk-size', str(options['chunk_size']),
+            '--pause', str(options['pause']), '--interval', str(options['interval']),
+        ]
+        if options['dry_run']:
+            argv.append('--dry-run')
+        with open(options['log'], 'a') as log:
+            proc = subprocess.Popen(argv, stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+        self.stdout.write(f"Reaper running in the background (pid {proc.pid}), logging to {options['log']}")
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from base import activity
+
+
+class Command(BaseCommand):
+    help = 'Rebuild hourly room activity rollups from messages and prune old buckets'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=int, default=24 * 7, help='Finished hours to rebuild')
+        parser.add_argument('--retention-days', type=int, help='Default: ACTIVITY_RETENTION_DAYS (90)')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        written, pruned = activity.compact(options['hours'], options['retention_days'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt {written} buckets, pruned {pruned} in {time.perf_counter() - start:.1f}s'
+        ))
@@ -0,0 +1,263 @@
+"""In-process ring buffer of recent messages for hot rooms.
+
+Each buffered room keeps its newest ``CHAT_BUFFER_PER_ROOM`` messages, already
+serialized the way ``get_room_messages`` returns them, so the first page of a
+busy room is served without touching the database. Rooms are evicted least
+recently used first once ``CHAT_BUFFER_MAX_ROOMS`` or the approximate
+``CHAT_BUFFER_MAX_BYTES`` budget is exceeded.
+
+A room only enters the buffer through ``prime()`` after a full DB read, and
+writes (``append``/``update``/``remove``) only touch rooms that are already
+buffered. ``prime()`` refuses a snapshot if any write to that room happened
+after the read began (see ``load_token()``), so a cold read racing a send can't
+install a stale window.
+
+Workers keep each other's buffers coherent through ``base.events``:
+``apply_events()`` replays peers' message events and drops rooms on anything
+it can't replay. That only reaches other processes with a shared event bus
+backend (``socket``/``postgres``). With the default ``memory`` backend each
+hit is checked first with ``fingerprint()``, one aggregate over the window's
+range of the ``(room, id)`` index. A window that another process wrote past
+(new, deleted or edited messages) is dropped and read again.
+"""
+import threading
+from collections import OrderedDict, deque
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.dateparse import parse_datetime
+
+from . import events
+from .models import ChatMessage
+
+# Rough per-message overhead of the dict, datetime and ints, in bytes.
+MESSAGE_OVERHEAD = 400
+# Bound on the per-room write log used to reject stale primes.
+MAX_TRACKED_WRITES = 10000
+
+
+def _size(msg):
+    return MESSAGE_OVERHEAD + len(msg['message']) + len(msg['sender_name']) + len(msg['sender_uid'])
+
+
+def _expected(messages):
+    """The ``fingerprint()`` the database has if ``messages`` is current"""
+    edits = [m['edited_at'] for m in messages if m.get('edited_at')]
+    return (messages[-1]['id'] if messages else None, len(messages), max(edits, default=None))
+
+
+def fingerprint(room_id, first_id):
+    """(newest id, count, last edit) of a room's messages with id >= ``first_id``"""
+    row = ChatMessage.objects.filter(room_id=room_id, id__gte=first_id).aggregate(
+        newest=Max('id'), count=Count('id'), edited=Max('edited_at')
+    )
+    return row['newest'], row['count'], row['edited']
+
+
+class RoomWindow:
+    __slots__ = ('name', 'messages', 'has_all', 'size')
+
+    def __init__(self, name, messages, per_room, has_all):
+        self.name = name
+        self.messages = deque(messages, maxlen=per_room)
+        self.has_all = has_all
+        self.size = sum(_size(m) for m in self.messages)
+
+
+class RecentMessages:
+    def __init__(self, per_room=100, max_rooms=1000, max_bytes=32 * 1024 * 1024):
+        self.per_room = per_room
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self.rooms = OrderedDict()
+        self.lock = threading.Lock()
+        self.bytes = 0
+        self.seq = 0
+        self.floor = 0
+        self.last_write = {}
+        self.hits = self.misses = self.evictions = self.rejected_primes = self.stale_reads = 0
+
+    # -------------------- reads --------------------
+
+    def read(self, room_id, limit, validate=None):
+        """(room_name, newest ``limit`` messages oldest-first), or None on a miss
+
+        With ``validate`` (``fingerprint``, or a function like it) the window is
+        only served if the database still agrees with it; otherwise it's dropped.
+        """
+        with self.lock:
+            window = self.rooms.get(room_id)
+            if window is None or (limit > len(window.messages) and not window.has_all):
+                self.misses += 1
+                return None
+            messages = [dict(m) for m in window.messages]
+        # Outside the lock: the check is a DB round trip.
+        if validate is not None and validate(room_id, messages[0]['id'] if messages else 0) != _expected(messages):
+            with self.lock:
+                if self.rooms.get(room_id) is window:
+                    self._drop(room_id)
+                self.misses += 1
+                self.stale_reads += 1
+            return None
+        with self.lock:
+            if self.rooms.get(room_id) is window:
+                self.rooms.move_to_end(room_id)
+            self.hits += 1
+        return window.name, messages[-limit:]
+
+    def load_token(self):
+        """Take before a DB read whose result will be passed to ``prime()``"""
+        return self.seq
+
+    def prime(self, room_id, name, messages, has_all, token):
+        """Install the newest messages of a room read from the DB at ``token``"""
+        with self.lock:
+            if token < self.floor or self.last_write.get(room_id, 0) > token:
+                self.rejected_primes += 1
+                return False
+            self._drop(room_id)
+            window = RoomWindow(name, (dict(m) for m in messages[-self.per_room:]), self.per_room, has_all)
+            self.rooms[room_id] = window
+            self.bytes += window.size
+            self._enforce_limits()
+            return True
+
+    # -------------------- writes --------------------
+
+    def append(self, room_id, msg):
+        with self.lock:
+            self._touch(room_id)
+            window = self.rooms.get(room_id)
+            if window is None or any(m['id'] == msg['id'] for m in window.messages):
+                return
+            if len(window.messages) == window.messages.maxlen:
+                evicted = window.messages[0]
+                window.size -= _size(evicted)
+                self.bytes -= _size(evicted)
+                window.has_all = False
+            window.messages.append(dict(msg))
+            if len(window.messages) > 1 and window.messages[-2]['id'] > msg['id']:
+                # Concurrent sends can finish out of order; keep id order.
+                window.messages = deque(sorted(window.messages, key=lambda m: m['id']), maxlen=self.per_room)
+            window.size += _size(msg)
+            self.bytes += _size(msg)
+            self._enforce_limits()
+
+    def update(self, room_id, message_id, **fields):
+        with self.lock:
+            self._touch(room_id)
+            window = self.rooms.get(room_id)
+            if window is None:
+                return
+            for msg in window.messages:
+                if msg['id'] == message_id:
+                    before = _size(msg)
+                    msg.update(fields)
+                    window.size += _size(msg) - before
+                    self.bytes += _size(msg) - before
+                    return
+
+    def remove(self, room_id, message_id):
+        with self.lock:
+            self._touch(room_id)
+            window = self.rooms.get(room_id)
+            if window is None:
+                return
+            for msg in window.messages:
+                if msg['id'] == message_id:
+                    window.messages.remove(msg)
+                    window.size -= _size(msg)
+                    self.bytes -= _size(msg)
+                    return
+
+    def invalidate(self, room_id):
+        with self.lock:
+            self._touch(room_id)
+            self._drop(room_id)
+
+    def clear(self):
+        with self.lock:
+            self.rooms.clear()
+            self.bytes = 0
+            self.floor = self.seq = self.seq + 1
+            self.last_write.clear()
+
+    # -------------------- bookkeeping --------------------
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'rooms': len(self.rooms),
+                'messages': sum(len(w.messages) for w in self.rooms.values()),
+                'bytes': self.bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else None,
+                'evictions': self.evictions,
+                'rejected_primes': self.rejected_primes,
+                'stale_reads': self.stale_reads,
+            }
+
+    def _touch(self, room_id):
+        self.seq += 1
+        self.last_write[room_id] = self.seq
+        if len(self.last_write) > MAX_TRACKED_WRITES:
+            # Forget individual rooms; any read started before now is stale.
+            self.last_write.clear()
+            self.floor = self.seq
+
+    def _drop(self, room_id):
+        window = self.rooms.pop(room_id, None)
+        if window is not None:
+            self.bytes -= window.size
+
+    def _enforce_limits(self):
+        while self.rooms and (len(self.rooms) > self.max_rooms or self.bytes > self.max_bytes):
+            _, window = self.rooms.popitem(last=False)
+            self.bytes -= window.size
+            self.evictions += 1
+
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+
+def get_buffer():
+    """The process-wide buffer, configured from settings on first use"""
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = RecentMessages(
+                    per_room=getattr(settings, 'CHAT_BUFFER_PER_ROOM', 100),
+                    max_rooms=getattr(settings, 'CHAT_BUFFER_MAX_ROOMS', 1000),
+                    max_bytes=getattr(settings, 'CHAT_BUFFER_MAX_BYTES', 32 * 1024 * 1024),
+                )
+    return _buffer
+
+
+def apply_events(batch):
+    """Event bus subscriber: mirror peers' writes into this worker's buffer"""
+    buffer = get_buffer()
+    for event in batch:
+        kind, room_id, data = event['type'], event['room_id'], event['data']
+        if kind == events.BUS_GAP:
+            buffer.clear()  # Any window may have missed a write
+        elif kind == events.MESSAGE_CREATED and 'message' in data:
+            buffer.append(room_id, {
+                **data,
+                'created_at': parse_datetime(data['created_at']),
+                'edited_at': data.get('edited_at') and parse_datetime(data['edited_at']),
+            })
+        elif kind == events.MESSAGE_EDITED and 'message' in data:
+            buffer.update(
+                room_id, data['id'], message=data['message'], is_edited=True,
+                edited_at=parse_datetime(data['edited_at']),
+            )
+        elif kind == events.MESSAGE_DELETED:
+            buffer.remove(room_id, data['id'])
+        elif kind in (events.MESSAGE_CREATED, events.MESSAGE_EDITED, events.ROOM_CHANGED):
+            # Body too large to ship, or the room itself changed.
+            buffer.invalidate(room_id)
@@ -0,0 +1,95 @@
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+from django.utils.text import compress_sequence, compress_string
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+re_accepts_gzip = _lazy_re_compile(r'\bgzip\b')
+re_accepts_br = _lazy_re_compile(r'\bbr\b')
+
+# Bodies smaller than this gain less than the Content-Encoding costs; the
+# default for COMPRESSION_MIN_SIZE.
+DEFAULT_MIN_SIZE = 512
+
+# Already-compressed payloads; recompressing them only burns CPU.
+INCOMPRESSIBLE_TYPES = ('image/', 'video/', 'audio/', 'font/', 'application/zip', 'application/gzip')
+
+
+def brotli_sequence(sequence, quality):
+    """Streaming counterpart of ``brotli.compress``"""
+    compressor = brotli.Compressor(quality=quality)
+    for item in sequence:
+        chunk = compressor.process(item)
+        if chunk:
+            yield chunk
+    yield compressor.finish()
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with brotli (when installed and accepted) or gzip.
+
+    Like Django's GZipMiddleware, but with a configurable size threshold
+    (``COMPRESSION_MIN_SIZE``) and brotli support. Place it above
+    ConditionalGetMiddleware so ETags are computed on the uncompressed body.
+    """
+    def __init__(self, get_response):
+        super().__init__(get_response)
+        self.min_size = getattr(settings, 'COMPRESSION_MIN_SIZE', DEFAULT_MIN_SIZE)
+        self.brotli_quality = getattr(settings, 'COMPRESSION_BROTLI_QUALITY', 5)
+
+    def select_encoding(self, request):
+        ae = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and re_accepts_br.search(ae):
+            return 'br'
+        if re_accepts_gzip.search(ae):
+            return 'gzip'
+        return None
+
+    def process_response(self, request, response):
+        # It's not worth attempting to compress short responses.
+        if not response.streaming and len(response.content) < self.min_size:
+            return response
+
+        # Avoid compressing if we've already got a content-encoding.
+        if response.has_header('Content-Encoding'):
+            return response
+        if response.get('Content-Type', '').startswith(INCOMPRESSIBLE_TYPES):
+            return response
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        encoding = self.select_encoding(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            if encoding == 'br':
+                response.streaming_content = brotli_sequence(response.streaming_content, self.brotli_quality)
+            else:
+                response.streaming_content = compress_sequence(response.streaming_content)
+            del response.headers['Content-Length']
+        else:
+            if encoding == 'br':
+                compressed_content = brotli.compress(response.content, quality=self.brotli_quality)
+            else:
+                compressed_content = compress_string(response.content)
+            # Return the compressed content only if it's actually shorter.
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # A compressed body is a different representation, so a strong ETag
+        # becomes weak (RFC 7232 section 2.1); If-None-Match still matches.
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = encoding
+
+        return response
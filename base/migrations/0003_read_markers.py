@@ -0,0 +1,22 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0002_auto_20251123_1401'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roommember',
+            name='last_read_message_id',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='chatmessage',
+            index=models.Index(fields=['room', 'id'], name='base_chatme_room_id_ff2b40_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0003_read_markers'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['-created_at'], name='base_room_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roommember',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['room', '-joined_at'], name='base_member_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='roommember',
+            index=models.Index(fields=['uid', 'room'], name='base_member_uid_room_idx'),
+        ),
+    ]
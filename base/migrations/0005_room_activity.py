@@ -0,0 +1,33 @@
+# Generated by Django 3.2.25 on 2026-10-19 16:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0004_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomActivity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('message_count', models.IntegerField(default=0)),
+                ('peak_members', models.IntegerField(default=0)),
+                ('last_activity_at', models.DateTimeField(blank=True, null=True)),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activity', to='base.room')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='roomactivity',
+            index=models.Index(fields=['bucket'], name='base_roomac_bucket_fe1490_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='roomactivity',
+            unique_together={('room', 'bucket')},
+        ),
+    ]
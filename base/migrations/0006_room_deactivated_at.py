@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0005_room_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='deactivated_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
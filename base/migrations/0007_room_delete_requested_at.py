@@ -0,0 +1,18 @@
+# Generated by Django 3.2.25 on 2026-10-19 18:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('base', '0006_room_deactivated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='room',
+            name='delete_requested_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
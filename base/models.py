@@ -12,6 +12,8 @@ class Room(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     is_active = models.BooleanField(default=True)
+    deactivated_at = models.DateTimeField(blank=True, null=True)  # Set only by the idle reaper, which purges on it
+    delete_requested_at = models.DateTimeField(blank=True, null=True)  # Deleted in the admin; purged next reaper pass
     description = models.TextField(blank=True, null=True)
     max_members = models.IntegerField(default=10)
     
@@ -20,6 +22,10 @@ class Room(models.Model):
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            # Active room listing (partial where the backend supports it)
+            models.Index(fields=['-created_at'], condition=models.Q(is_active=True), name='base_room_active_idx'),
+        ]
 
 
 class RoomMember(models.Model):
@@ -29,6 +35,7 @@ class RoomMember(models.Model):
     uid = models.CharField(max_length=1000)
     joined_at = models.DateTimeField(auto_now_add=True)
     is_active = models.BooleanField(default=True)
+    last_read_message_id = models.BigIntegerField(default=0)  # Read high-water mark
 
     def __str__(self):
         return f"{self.name} in {self.room.name}"
@@ -36,6 +43,13 @@ class RoomMember(models.Model):
     class Meta:
         unique_together = ['room', 'uid']
         ordering = ['-joined_at']
+        indexes = [
+            # Active member counts and listings per room
+            models.Index(fields=['room', '-joined_at'], condition=models.Q(is_active=True),
+                         name='base_member_active_idx'),
+            # Lookups by member uid across rooms (unique_together leads with room)
+            models.Index(fields=['uid', 'room'], name='base_member_uid_room_idx'),
+        ]
 
 
 class ChatMessage(models.Model):
@@ -55,4 +69,23 @@ class ChatMessage(models.Model):
         ordering = ['created_at']
         indexes = [
             models.Index(fields=['room', '-created_at']),
+            models.Index(fields=['room', 'id']),  # Unread counts: id > high-water mark
+        ]
+
+
+class RoomActivity(models.Model):
+    """Hourly activity rollup per room, kept current by the write paths"""
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='activity')
+    bucket = models.DateTimeField()  # Start of the hour
+    message_count = models.IntegerField(default=0)
+    peak_members = models.IntegerField(default=0)  # Most active members seen at once
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.room_id} @ {self.bucket:%Y-%m-%d %H:00}"
+
+    class Meta:
+        unique_together = ['room', 'bucket']
+        indexes = [
+            models.Index(fields=['bucket']),  # Dashboard windows and pruning
         ]
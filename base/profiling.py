@@ -0,0 +1,268 @@
+"""On-demand profiling of single requests.
+
+With ``PROFILING['ENABLED']`` off, ``ProfilingMiddleware`` raises
+``MiddlewareNotUsed`` and Django leaves it out of the chain, so there is no
+per-request cost at all. When it is on, a request is profiled if any of these
+holds:
+
+- it carries ``X-Profile: <token>``, a signed, expiring token from
+  ``manage.py profile_token`` (works on every route, no session needed);
+- it has ``?_profile=1`` and ``request.user`` is staff;
+- it is picked by ``PROFILING['SAMPLE_RATE']`` (0.0 - 1.0).
+
+A profiled request records a cProfile report (``ENGINE = 'cprofile'``) or a
+sampled stack profile in collapsed-stack form, ready for flamegraph.pl or
+speedscope (``ENGINE = 'sampling'``). It also records a timeline of every SQL
+statement (offset, duration, SQL; no parameters). Each profile is one JSON file
+in ``PROFILING['DIR']``, and only the newest ``MAX_PROFILES`` are kept. The
+response carries ``X-Profile-Id``. Staff can list and read profiles at
+``/profiles/``.
+"""
+import io
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core import signing
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+HEADER = 'HTTP_X_PROFILE'
+QUERY_FLAG = '_profile'
+SALT = 'base.profiling'
+PROFILE_ID = re.compile(r'^\d+-[0-9a-f]{8}$')
+
+
+def get_config():
+    return {
+        'ENABLED': False,
+        'ENGINE': 'cprofile',
+        'SAMPLE_RATE': 0.0,
+        'SAMPLE_INTERVAL_MS': 2,
+        'DIR': os.path.join(tempfile.gettempdir(), 'streambeat-profiles'),
+        'MAX_PROFILES': 50,
+        'TOP_FUNCTIONS': 40,
+        **getattr(settings, 'PROFILING', {}),
+    }
+
+
+# ==================== TRIGGERS ====================
+
+def make_token(ttl=3600):
+    """Signed value for the X-Profile header, valid for ``ttl`` seconds"""
+    return signing.dumps({'exp': int(time.time()) + ttl}, salt=SALT)
+
+
+def valid_token(token):
+    try:
+        data = signing.loads(token, salt=SALT)
+    except signing.BadSignature:
+        return False
+    return data.get('exp', 0) > time.time()
+
+
+def trigger(request, sample_rate):
+    """Why this request should be profiled ('header', 'staff', 'sampled'), or None"""
+    token = request.META.get(HEADER)
+    if token and valid_token(token):
+        return 'header'
+    if QUERY_FLAG in request.GET:
+        user = getattr(request, 'user', None)
+        if user is not None and user.is_staff:
+            return 'staff'
+    if sample_rate and random.random() < sample_rate:
+        return 'sampled'
+    return None
+
+
+# ==================== RECORDERS ====================
+
+class SQLTimeline:
+    """``execute_wrapper`` that records when each statement ran and for how long"""
+
+    def __init__(self, start):
+        self.start = start
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        begin = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append({
+                'db': context['connection'].alias,
+                'start_ms': round((begin - self.start) * 1000, 3),
+                'ms': round((time.perf_counter() - begin) * 1000, 3),
+                'sql': sql[:2000],
+                'many': many,
+            })
+
+
+class StackSampler:
+    """Samples one thread's Python stack every ``interval`` seconds"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+
+    def run(self):
+        while not self.done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(f"{frame.f_globals.get('__name__', '?')}.{frame.f_code.co_name}")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.done.set()
+        self.thread.join()
+
+    def collapsed(self):
+        """Brendan Gregg's collapsed-stack format: 'a;b;c <samples>' per line"""
+        return '\n'.join(f'{stack} {count}' for stack, count in self.stacks.most_common())
+
+
+def _cprofile_report(profiler, top):
+    import pstats
+
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).strip_dirs().sort_stats('cumulative').print_stats(top)
+    return out.getvalue()
+
+
+# ==================== STORAGE ====================
+
+class ProfileStore:
+    """Newest ``max_profiles`` profiles as JSON files in ``directory``"""
+
+    def __init__(self, directory, max_profiles):
+        self.directory = directory
+        self.max_profiles = max_profiles
+
+    def _path(self, profile_id):
+        if not PROFILE_ID.match(profile_id):
+            raise KeyError(profile_id)
+        return os.path.join(self.directory, f'{profile_id}.json')
+
+    def _ids(self):
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        ids = [name[:-5] for name in names if name.endswith('.json') and PROFILE_ID.match(name[:-5])]
+        return sorted(ids, key=lambda profile_id: int(profile_id.split('-')[0]))
+
+    def save(self, record):
+        os.makedirs(self.directory, exist_ok=True)
+        profile_id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+        record['id'] = profile_id
+        tmp = os.path.join(self.directory, f'.{profile_id}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp, self._path(profile_id))
+        for stale in self._ids()[:-self.max_profiles]:
+            try:
+                os.remove(self._path(stale))
+            except FileNotFoundError:
+                pass  # Pruned by another worker
+        return profile_id
+
+    def get(self, profile_id):
+        try:
+            with open(self._path(profile_id)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(profile_id)
+
+    def summaries(self):
+        """Newest first, without the bulky report fields"""
+        rows = []
+        for profile_id in reversed(self._ids()):
+            try:
+                record = self.get(profile_id)
+            except (KeyError, ValueError):
+                continue
+            rows.append({key: value for key, value in record.items() if key not in ('report', 'stacks', 'sql')})
+        return rows
+
+
+def get_store():
+    config = get_config()
+    return ProfileStore(config['DIR'], config['MAX_PROFILES'])
+
+
+# ==================== MIDDLEWARE ====================
+
+class ProfilingMiddleware:
+    def __init__(self, get_response):
+        self.config = get_config()
+        if not self.config['ENABLED']:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.store = ProfileStore(self.config['DIR'], self.config['MAX_PROFILES'])
+
+    def __call__(self, request):
+        reason = trigger(request, self.config['SAMPLE_RATE'])
+        if reason is None:
+            return self.get_response(request)
+        return self.profile(request, reason)
+
+    def profile(self, request, reason):
+        engine = self.config['ENGINE']
+        start = time.perf_counter()
+        timeline = SQLTimeline(start)
+        record = {'engine': engine}
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(timeline))
+            if engine == 'sampling':
+                sampler = stack.enter_context(
+                    StackSampler(threading.get_ident(), self.config['SAMPLE_INTERVAL_MS'] / 1000)
+                )
+                response = self.get_response(request)
+            else:
+                import cProfile
+
+                profiler = cProfile.Profile()
+                profiler.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    profiler.disable()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+
+        if engine == 'sampling':
+            record['stacks'] = sampler.collapsed()
+        else:
+            record['report'] = _cprofile_report(profiler, self.config['TOP_FUNCTIONS'])
+        record.update({
+            'trigger': reason,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'ms': round(elapsed_ms, 2),
+            'sql_count': len(timeline.queries),
+            'sql_ms': round(sum(q['ms'] for q in timeline.queries), 2),
+            'sql': timeline.queries,
+            'created_at': time.time(),
+        })
+        response['X-Profile-Id'] = self.store.save(record)
+        return response
@@ -0,0 +1,126 @@
+"""Bulk user import shared by the ``users/import/`` API and ``import_users`` command.
+
+Rows come from CSV (header row) or NDJSON (one object per line) with the keys
+``username``, ``password`` or ``password_hash``, and optionally ``email``,
+``first_name``, ``last_name``. ``password_hash`` must already be in Django's
+``<algorithm>$...`` format and is stored as is. PBKDF2 dominates the cost of
+an import, so the management command hashes plain passwords in a process pool
+(``workers``); the API hashes in its own worker, since web workers and lambdas
+shouldn't fork pools per request.
+"""
+import csv
+import io
+import json
+import os
+
+from django.contrib.auth.hashers import identify_hasher, make_password
+from django.contrib.auth.models import User
+
+FIELDS = ('username', 'email', 'first_name', 'last_name')
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def parse_rows(text, fmt):
+    """Parse CSV or NDJSON text into a list of dicts"""
+    if fmt == 'csv':
+        return list(csv.DictReader(io.StringIO(text)))
+    if fmt == 'ndjson':
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _init_worker(settings_module):
+    # Needed when workers are spawned rather than forked.
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_many(passwords):
+    return [make_password(p) for p in passwords]
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    """Hash ``passwords`` in order, spreading the work over ``pool`` if given"""
+    if pool is None or len(passwords) < 2:
+        return _hash_many(passwords)
+    size = max(1, -(-len(passwords) // (workers * 4)))
+    batches = [passwords[i:i + size] for i in range(0, len(passwords), size)]
+    return [h for batch in pool.map(_hash_many, batches) for h in batch]
+
+
+def validate_row(row):
+    """Return an error string, or None if the row can be imported"""
+    if not row.get('username'):
+        return 'username required'
+    if row.get('password_hash'):
+        try:
+            identify_hasher(row['password_hash'])
+        except ValueError:
+            return 'unrecognized password_hash'
+    elif not row.get('password'):
+        return 'password or password_hash required'
+    return None
+
+
+def import_users(rows, chunk_size=DEFAULT_CHUNK_SIZE, workers=1):
+    """
+    Create users from ``rows`` with ``bulk_create`` in chunks.
+
+    Existing usernames and duplicates within the input are skipped, including
+    usernames another request creates while the import runs. Returns
+    ``{'created': n, 'skipped': [...], 'errors': [{'row': i, 'message': ...}]}``.
+    """
+    result = {'created': 0, 'skipped': [], 'errors': []}
+    valid = []
+    seen = set()
+    for i, row in enumerate(rows, 1):
+        error = validate_row(row)
+        if error:
+            result['errors'].append({'row': i, 'message': error})
+        elif row['username'] in seen:
+            result['skipped'].append(row['username'])
+        else:
+            seen.add(row['username'])
+            valid.append(row)
+
+    pool = None
+    if workers > 1 and any(not row.get('password_hash') for row in valid):
+        from concurrent.futures import ProcessPoolExecutor
+
+        pool = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(os.environ.get('DJANGO_SETTINGS_MODULE', 'mychat.settings'),),
+        )
+    try:
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            existing = set(User.objects.filter(
+                username__in=[row['username'] for row in chunk]
+            ).values_list('username', flat=True))
+            result['skipped'].extend(sorted(existing))
+            chunk = [row for row in chunk if row['username'] not in existing]
+
+            plain = [row for row in chunk if not row.get('password_hash')]
+            for row, hashed in zip(plain, hash_passwords([row['password'] for row in plain], pool, workers)):
+                row['password_hash'] = hashed
+
+            # A username created concurrently is ignored instead of failing
+            # the chunk (and the import) halfway.
+            User.objects.bulk_create([
+                User(password=row['password_hash'], **{f: row.get(f) or '' for f in FIELDS})
+                for row in chunk
+            ], batch_size=chunk_size, ignore_conflicts=True)
+            # Hashes are salted, so a matching (username, hash) pair is a row this import wrote.
+            ours = {(row['username'], row['password_hash']) for row in chunk}
+            stored = User.objects.filter(
+                username__in=[row['username'] for row in chunk]
+            ).values_list('username', 'password')
+            written = {username for username, password in stored if (username, password) in ours}
+            result['created'] += len(written)
+            result['skipped'].extend(sorted(row['username'] for row in chunk if row['username'] not in written))
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return result
@@ -0,0 +1,172 @@
+"""Query-plan audit for the JSON views.
+
+``audit()`` seeds a throwaway dataset inside a transaction, calls each entry of
+``VIEW_REQUESTS`` through the test client, and runs ``EXPLAIN`` on every
+SELECT/UPDATE/DELETE the view issued. A plan that reads a whole table, or a
+whole index without a condition, is flagged. Views in ``LISTINGS`` return
+every active row, so walking a partial index end to end is fine there. On
+PostgreSQL
+``enable_seqscan`` is switched off first, so a small table only shows a full
+scan when no index can serve the predicate at all. Used by
+``manage.py explain_queries`` and the tests.
+"""
+import itertools
+import json
+import random
+import re
+from contextlib import contextmanager
+
+from django.core.cache import cache
+from django.db import connection, reset_queries, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from .message_buffer import get_buffer
+from .models import ChatMessage, Room, RoomMember
+
+# (label, method, path, JSON body); paths and bodies are formatted with the seed.
+VIEW_REQUESTS = (
+    ('get_rooms', 'get', '/rooms/', None),
+    ('get_room_by_code', 'get', '/rooms/by-code/?code={room_code}', None),
+    ('get_room_by_share_link', 'get', '/rooms/{share_link_id}/', None),
+    ('join_room', 'get', '/join/{share_link_id}/', None),
+    ('chat_room', 'get', '/chat/room/{room_id}/', None),
+    ('get_member', 'get', '/get_member/?UID={uid}&room_code={room_code}', None),
+    ('get_room_members', 'get', '/rooms/members/?room_id={room_id}', None),
+    ('get_room_messages', 'get', '/chat/messages/?room_id={room_id}', None),
+    ('get_room_messages (page)', 'get', '/chat/messages/?room_id={room_id}&limit=50&before_id={message_id}', None),
+    ('get_unread_counts', 'get', '/chat/unread/?uid={uid}', None),
+    ('get_room_stats', 'get', '/rooms/stats/', None),
+    ('get_room_stats (room)', 'get', '/rooms/stats/?room_id={room_id}', None),
+    ('get_users (page)', 'get', '/users/?limit=50', None),
+    ('create_member', 'post', '/create_member/', {'room_code': '{room_code}', 'UID': 'audit-new', 'name': 'Audit'}),
+    ('add_room_member', 'post', '/rooms/members/add/', {'room_id': '{room_id}', 'uid': 'audit-add', 'name': 'Audit'}),
+    ('send_chat_message', 'post', '/chat/send/',
+     {'room_id': '{room_id}', 'sender_name': 'Audit', 'sender_uid': '{uid}', 'message': 'audit'}),
+    ('edit_chat_message', 'post', '/chat/edit/', {'message_id': '{message_id}', 'message': 'edited'}),
+    ('mark_read', 'post', '/chat/read/', {'room_id': '{room_id}', 'uid': '{uid}', 'message_id': '{message_id}'}),
+    ('delete_chat_message', 'post', '/chat/delete/', {'message_id': '{message_id}'}),
+)
+
+# Views that return every active row of a table by design.
+LISTINGS = {'get_rooms'}
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+# SQLite: "SCAN t" / "SCAN t USING INDEX i" read everything; "SEARCH" doesn't.
+SQLITE_SCAN = re.compile(r'\bSCAN (?:TABLE )?(?!CONSTANT ROW)(\w+)(?: AS \w+)?(?: USING (?:COVERING )?INDEX (\w+))?')
+# PostgreSQL: a Seq Scan, or an index scan node with no Index Cond under it.
+PG_SEQ_SCAN = re.compile(r'Seq Scan on (\w+)')
+PG_INDEX_SCAN = re.compile(r'Index (?:Only )?Scan (?:Backward )?using (\w+) on (\w+)')
+
+
+@contextmanager
+def seeded_dataset(rooms=200, members=20, messages=50):
+    """Rooms (every tenth inactive) with members and messages; rolled back on exit"""
+    with transaction.atomic():
+        tag = f'{random.getrandbits(32):08x}'
+        Room.objects.bulk_create([
+            Room(name=f'audit-{tag}-{i}', room_code=f'A{tag[:5]}{i:04d}'[:10], is_active=i % 10 != 0,
+                 max_members=members * 2)
+            for i in range(rooms)
+        ])
+        seeded = list(Room.objects.filter(name__startswith=f'audit-{tag}-'))
+        RoomMember.objects.bulk_create([
+            RoomMember(room=room, name=f'Member {j}', uid=f'{tag}-{j}', is_active=j % 4 != 0)
+            for room in seeded for j in range(members)
+        ], batch_size=1000)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=room, sender_name=f'Member {k % members}', sender_uid=f'{tag}-{k % members}',
+                        message=f'Audit message {k}')
+            for room in seeded for k in range(messages)
+        ], batch_size=1000)
+        try:
+            room = next(r for r in seeded if r.is_active)
+            yield {
+                'room_id': room.id,
+                'room_code': room.room_code,
+                'share_link_id': room.share_link_id,
+                'uid': f'{tag}-1',
+                'message_id': ChatMessage.objects.filter(room=room).order_by('-id').values_list('id', flat=True)[messages // 2],
+            }
+        finally:
+            transaction.set_rollback(True)
+
+
+def explain(sql):
+    """Plan lines for one captured statement"""
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}')
+            return [row[-1] for row in cursor.fetchall()]
+        cursor.execute(f'EXPLAIN {sql}')
+        return [row[0] for row in cursor.fetchall()]
+
+
+def partial_indexes():
+    return {index.name for model in (Room, RoomMember, ChatMessage) for index in model._meta.indexes if index.condition}
+
+
+def full_scans(plan):
+    """(table, index) for every node that reads a whole table (index None) or index"""
+    scans = []
+    if connection.vendor == 'sqlite':
+        for line in plan:
+            scans.extend(SQLITE_SCAN.findall(line))
+    elif connection.vendor == 'postgresql':
+        for i, line in enumerate(plan):
+            seq = PG_SEQ_SCAN.search(line)
+            if seq:
+                scans.append((seq.group(1), ''))
+                continue
+            index = PG_INDEX_SCAN.search(line)
+            if index:
+                node = itertools.takewhile(lambda detail: '->' not in detail, plan[i + 1:])
+                if not any('Index Cond' in detail for detail in node):
+                    scans.append((index.group(2), index.group(1)))
+    return [(table, index or None) for table, index in scans]
+
+
+def seq_scans(plan, allowed=()):
+    """Tables (or SQLite aliases) ``plan`` reads in full, other than via ``allowed`` indexes"""
+    return sorted({table for table, index in full_scans(plan) if index not in allowed})
+
+
+def _format(value, seed):
+    if isinstance(value, dict):
+        return {key: _format(v, seed) for key, v in value.items()}
+    return value.format(**seed) if isinstance(value, str) else value
+
+
+# audit() clears the cache before each view; it gets its own so the shared one is left alone.
+AUDIT_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'queryplans'}}
+
+
+def audit(rooms=200, members=20, messages=50):
+    """[{'view', 'status', 'queries': [{'sql', 'plan', 'seq_scans'}]}] for VIEW_REQUESTS"""
+    partial = partial_indexes()
+    client = Client()
+    results = []
+    with override_settings(RATELIMIT_ENABLE=False, CACHES=AUDIT_CACHES), seeded_dataset(rooms, members, messages) as seed:
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        for label, method, path, body in VIEW_REQUESTS:
+            # Cold caches, so the view's own queries run.
+            get_buffer().clear()
+            cache.clear()
+            reset_queries()
+            with CaptureQueriesContext(connection) as captured:
+                if body is None:
+                    response = getattr(client, method)(path.format(**seed))
+                else:
+                    response = client.post(path, json.dumps(_format(body, seed)), content_type='application/json')
+            queries = []
+            for query in captured.captured_queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(EXPLAINABLE):
+                    continue
+                plan = explain(sql)
+                allowed = partial if label in LISTINGS else ()
+                queries.append({'sql': sql, 'plan': plan, 'seq_scans': seq_scans(plan, allowed)})
+            results.append({'view': label, 'status': response.status_code, 'queries': queries})
+    return results
@@ -0,0 +1,136 @@
+"""Idle-room reaper.
+
+Two phases per pass:
+
+1. ``deactivate_idle()``: active rooms with no messages, joins or changes for
+   ``idle_days`` and no active members become inactive (one UPDATE) and get
+   ``deactivated_at``. Calls don't write messages, so members count as use.
+2. ``purge_inactive()``: rooms the reaper deactivated at least ``purge_days``
+   ago, with no messages or joins since and no active members, are deleted,
+   as are rooms deleted in the admin (``request_purge()``). Rooms deactivated
+   any other way (the admin action, a manual edit) have no ``deactivated_at``
+   and are never purged. Their child rows go first via
+   ``delete_children()``, in chunks of ``chunk_size`` ids, each one plain
+   ``DELETE ... WHERE room_id = %s AND id <= %s`` committed on its own (run
+   outside ``atomic()``). Then the empty room row is deleted.
+
+Django's ``Room.delete()`` loads every related row into the collector before
+deleting. Here only one boundary id per chunk is loaded, so memory stays flat
+and each lock is held for a single chunk, whatever the room's size. Children are
+found from ``Room``'s reverse foreign keys, so new child tables are covered as
+long as nothing else references them.
+
+Used by ``manage.py reap_rooms``. The admin's room delete only hides the room
+and marks it with ``request_purge()``: the admin runs deletes inside one
+transaction, which would hold every chunk's locks until the end.
+"""
+import time
+from datetime import timedelta
+
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import events
+from .message_buffer import get_buffer
+from .models import ChatMessage, Room, RoomMember
+
+DEFAULT_CHUNK_SIZE = 5000
+
+
+def child_relations():
+    """(model, room fk attname) for every table that cascades from Room"""
+    return [(rel.related_model, rel.field.attname) for rel in Room._meta.related_objects]
+
+
+def forget_room(room_id):
+    """Drop a room from this worker's message buffer and tell the other workers"""
+    get_buffer().invalidate(room_id)
+    events.publish(room_id, events.ROOM_CHANGED)
+
+
+def _unused(rooms, since):
+    """``rooms`` with no messages or joins at/after ``since`` and no active members"""
+    members = RoomMember.objects.filter(room=OuterRef('pk'))
+    return rooms.exclude(
+        Exists(ChatMessage.objects.filter(room=OuterRef('pk'), created_at__gte=since))
+    ).exclude(
+        Exists(members.filter(joined_at__gte=since))
+    ).exclude(
+        Exists(members.filter(is_active=True))
+    )
+
+
+def request_purge(room_ids):
+    """Hide rooms now and leave deleting their rows to the next reaper pass"""
+    now = timezone.now()
+    updated = Room.objects.filter(id__in=room_ids).update(is_active=False, delete_requested_at=now, updated_at=now)
+    for room_id in room_ids:
+        forget_room(room_id)
+    return updated
+
+
+def idle_rooms(idle_days, now=None):
+    cutoff = (now or timezone.now()) - timedelta(days=idle_days)
+    return _unused(Room.objects.filter(is_active=True, updated_at__lt=cutoff), cutoff)
+
+
+def deactivate_idle(idle_days, limit=None, dry_run=False):
+    """Mark idle rooms inactive; returns their ids"""
+    ids = list(idle_rooms(idle_days).order_by('id').values_list('id', flat=True)[:limit])
+    if ids and not dry_run:
+        now = timezone.now()
+        Room.objects.filter(id__in=ids, is_active=True).update(is_active=False, deactivated_at=now, updated_at=now)
+        for room_id in ids:
+            forget_room(room_id)
+    return ids
+
+
+def delete_children(room_id, chunk_size=DEFAULT_CHUNK_SIZE, pause=0.0):
+    """Delete every child row of a room in id-range chunks; {table: rows}"""
+    deleted = {}
+    for model, attname in child_relations():
+        rows = model._base_manager.filter(**{attname: room_id}).order_by()
+        total = 0
+        while True:
+            # The chunk's upper id bound is the only row loaded.
+            bound = list(rows.order_by('pk').values_list('pk', flat=True)[chunk_size - 1:chunk_size])
+            chunk = rows.filter(pk__lte=bound[0]) if bound else rows
+            count = chunk._raw_delete(rows.db)
+            total += count
+            if not bound or not count:
+                break
+            if pause:
+                time.sleep(pause)
+        deleted[model._meta.db_table] = total
+    return deleted
+
+
+def purge_room(room_id, chunk_size=DEFAULT_CHUNK_SIZE, pause=0.0):
+    """Delete a room and all of its rows without loading them; {table: rows}"""
+    deleted = delete_children(room_id, chunk_size, pause)
+    # Children are gone, so the collector has nothing left to load.
+    deleted[Room._meta.db_table] = Room.objects.filter(id=room_id).delete()[0]
+    forget_room(room_id)
+    return deleted
+
+
+def purgeable_rooms(purge_days, now=None):
+    cutoff = (now or timezone.now()) - timedelta(days=purge_days)
+    idle = _unused(Room.objects.filter(is_active=False, deactivated_at__lt=cutoff), OuterRef('deactivated_at'))
+    return Room.objects.filter(Q(delete_requested_at__isnull=False) | Q(id__in=idle.values('id')))
+
+
+def purge_inactive(purge_days, limit=None, chunk_size=DEFAULT_CHUNK_SIZE, pause=0.0, dry_run=False):
+    """Purge rooms deleted in the admin or deactivated ``purge_days`` ago; {room_id: {table: rows}}"""
+    ids = list(purgeable_rooms(purge_days).order_by('id').values_list('id', flat=True)[:limit])
+    if dry_run:
+        return {room_id: {} for room_id in ids}
+    return {room_id: purge_room(room_id, chunk_size, pause) for room_id in ids}
+
+
+def reap(idle_days, purge_days, limit=None, chunk_size=DEFAULT_CHUNK_SIZE, pause=0.0, dry_run=False):
+    """One reaper pass: {'deactivated': [ids], 'purged': {room_id: {table: rows}}}"""
+    return {
+        'deactivated': deactivate_idle(idle_days, limit, dry_run),
+        'purged': purge_inactive(purge_days, limit, chunk_size, pause, dry_run),
+    }
@@ -0,0 +1,56 @@
+"""Serve collected static files from the app when there is no CDN in front.
+
+Picks the precompressed ``.br``/``.gz`` sibling written by
+``base.storage.CompressedManifestStaticFilesStorage`` when the client accepts
+it, and marks fingerprinted files as immutable.
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+from .middleware import re_accepts_br, re_accepts_gzip
+
+# name.<12 hex chars>.ext, as produced by ManifestStaticFilesStorage
+re_hashed_name = re.compile(r'\.[0-9a-f]{12}\.[^/.]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+REVALIDATE = 'public, max-age=0, must-revalidate'
+
+
+def serve(request, path):
+    """Serve ``path`` from STATIC_ROOT, preferring precompressed variants"""
+    try:
+        fullpath = safe_join(settings.STATIC_ROOT, path)
+    except ValueError:
+        raise Http404('Invalid path')
+    if not os.path.isfile(fullpath):
+        raise Http404('File not found')
+
+    content_type, _ = mimetypes.guess_type(fullpath)
+    encoding = None
+    ae = request.META.get('HTTP_ACCEPT_ENCODING', '')
+    if re_accepts_br.search(ae) and os.path.isfile(fullpath + '.br'):
+        encoding, fullpath = 'br', fullpath + '.br'
+    elif re_accepts_gzip.search(ae) and os.path.isfile(fullpath + '.gz'):
+        encoding, fullpath = 'gzip', fullpath + '.gz'
+
+    stat = os.stat(fullpath)
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime, stat.st_size):
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(fullpath, 'rb'), content_type=content_type or 'application/octet-stream')
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        if encoding:
+            response['Content-Encoding'] = encoding
+
+    response['Cache-Control'] = IMMUTABLE if re_hashed_name.search(path) else REVALIDATE
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
@@ -0,0 +1,52 @@
+import gzip
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, .gz siblings are always written
+    brotli = None
+
+# Text formats worth precompressing; images and fonts are already compressed.
+COMPRESSIBLE_EXTENSIONS = ('.js', '.css', '.svg', '.html', '.json', '.txt', '.xml', '.map')
+# Precompression happens once at build time, so even small assets get siblings.
+PRECOMPRESS_MIN_SIZE = 200
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """
+    Fingerprinted static files with precompressed siblings.
+
+    ``collectstatic`` writes ``name.<hash>.ext`` plus ``.gz`` (and ``.br`` when
+    brotli is installed) next to every hashed text asset, so they can be served
+    with far-future ``Cache-Control`` (see ``base.staticserve``).
+    """
+    def post_process(self, paths, dry_run=False, **options):
+        yield from super().post_process(paths, dry_run, **options)
+
+        if dry_run:
+            return
+        # Intermediate names from earlier passes are gone; only the final
+        # manifest entries exist on disk.
+        for hashed_name in set(self.hashed_files.values()):
+            if hashed_name.endswith(COMPRESSIBLE_EXTENSIONS):
+                self.write_compressed(hashed_name)
+
+    def write_compressed(self, name):
+        """Write ``name.gz``/``name.br`` when they are smaller than ``name``"""
+        path = self.path(name)
+        with open(path, 'rb') as f:
+            content = f.read()
+        if len(content) < PRECOMPRESS_MIN_SIZE:
+            return
+
+        variants = [('.gz', gzip.compress(content, compresslevel=9, mtime=0))]
+        if brotli is not None:
+            variants.append(('.br', brotli.compress(content, quality=11)))
+        for suffix, compressed in variants:
+            if len(compressed) < len(content):
+                with open(path + suffix, 'wb') as f:
+                    f.write(compressed)
+            elif os.path.exists(path + suffix):
+                os.remove(path + suffix)
@@ -1,3 +1,811 @@
-from django.test import TestCase
+import gzip
+import json
+import os
+import socket
+import tempfile
+import threading
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.test import Client, RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import path
+from django.utils import timezone
+
+from . import (
+    activity, coldstart, events, middleware, profiling, provisioning, queryplans, reaper, staticserve,
+    throttling, views, wire,
+)
+from .fastlane import full_stack
+from .message_buffer import RecentMessages, apply_events, get_buffer
+from .middleware import CompressionMiddleware
+from .models import ChatMessage, Room, RoomMember
+from .storage import CompressedManifestStaticFilesStorage
+
+
+class WireFormatTests(TestCase):
+    def test_pack_round_trips(self):
+        start = timezone.now().replace(microsecond=0)
+        rows = [
+            {'id': 1, 'sender_name': 'a', 'sender_uid': 'u1', 'message': 'one', 'created_at': start,
+             'is_edited': False, 'edited_at': None},
+            {'id': 2, 'sender_name': 'b', 'sender_uid': 'u2', 'message': 'two', 'created_at': start + timedelta(seconds=4),
+             'is_edited': True, 'edited_at': start + timedelta(seconds=9)},
+            {'id': 3, 'sender_name': 'a', 'sender_uid': 'u1', 'message': 'three', 'created_at': start + timedelta(seconds=5),
+             'is_edited': False, 'edited_at': None},
+        ]
+        packed = wire.pack_messages(rows)
+        self.assertEqual(packed['senders'], [['a', 'u1'], ['b', 'u2']])
+        self.assertEqual(packed['created_at'][1:], [4000, 1000])
+        self.assertEqual(wire.unpack_messages(json.loads(json.dumps(packed))), [
+            {**row, 'created_at': wire.epoch_ms(row['created_at']),
+             'edited_at': row['edited_at'] and wire.epoch_ms(row['edited_at'])}
+            for row in rows
+        ])
+
+    def test_compact_matches_rows_through_the_view(self):
+        room = Room.objects.create(name='Wire', room_code='WIRE01')
+        for i in range(3):
+            ChatMessage.objects.create(room=room, sender_name='a', sender_uid=f'u{i % 2}', message=str(i))
+        ChatMessage.objects.filter(message='1').update(is_edited=True, edited_at=timezone.now())
+        url = f'/chat/messages/?room_id={room.id}'
+
+        rows = self.client.get(url).json()['messages']
+        response = self.client.get(url + '&format=compact').json()
+        self.assertEqual(response['format'], 'compact')
+        compact = wire.unpack_messages(response['messages'])
+        self.assertEqual(
+            [(m['id'], m['sender_uid'], m['message'], m['is_edited'], m['edited_at'] is not None) for m in compact],
+            [(m['id'], m['sender_uid'], m['message'], m['is_edited'], m['edited_at'] is not None) for m in rows],
+        )
+
+
+class CompressionTests(TestCase):
+    BODY = 'streambeat ' * 200
+
+    def compress(self, response, accept='gzip, br'):
+        request = RequestFactory().get('/', HTTP_ACCEPT_ENCODING=accept)
+        return CompressionMiddleware(lambda request: response)(request)
+
+    def test_threshold_and_encoding_choice(self):
+        self.assertFalse(self.compress(HttpResponse('x' * 100)).has_header('Content-Encoding'))
+
+        response = self.compress(HttpResponse(self.BODY), accept='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content).decode(), self.BODY)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+        self.assertFalse(self.compress(HttpResponse(self.BODY), accept='identity').has_header('Content-Encoding'))
+
+    @skipIf(middleware.brotli is None, 'brotli is not installed')
+    def test_prefers_brotli(self):
+        response = self.compress(HttpResponse(self.BODY))
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(middleware.brotli.decompress(response.content).decode(), self.BODY)
+
+    def test_skips_incompressible_types(self):
+        response = self.compress(HttpResponse(self.BODY, content_type='image/png'))
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_streaming(self):
+        response = self.compress(StreamingHttpResponse(iter([self.BODY] * 3)), accept='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertFalse(response.has_header('Content-Length'))
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)).decode(), self.BODY * 3)
+
+    def test_strong_etag_becomes_weak(self):
+        response = HttpResponse(self.BODY)
+        response['ETag'] = '"abc"'
+        self.assertEqual(self.compress(response, accept='gzip')['ETag'], 'W/"abc"')
+
+    def test_repeat_get_is_not_modified(self):
+        room = Room.objects.create(name='Cached', room_code='CACH01')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=room, sender_name='a', sender_uid='u1', message=self.BODY) for _ in range(3)
+        ])
+        for url in ('/manage-users/', f'/chat/messages/?room_id={room.id}'):
+            first = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+            self.assertEqual(first['Content-Encoding'], 'gzip', url)
+            repeat = self.client.get(url, HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_NONE_MATCH=first['ETag'])
+            self.assertEqual(repeat.status_code, 304, url)
+
+
+class StaticFilesTests(SimpleTestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.root = os.path.join(tmp.name, 'root')
+        source = FileSystemStorage(os.path.join(tmp.name, 'src'))
+        source.save('app.js', ContentFile('console.log("streambeat");\n' * 100))
+        source.save('tiny.css', ContentFile('a{}'))
+        source.save('logo.png', ContentFile(b'\x89PNG' + bytes(range(256)) * 4))
+        storage = CompressedManifestStaticFilesStorage(location=self.root, base_url='/static/')
+        list(storage.post_process({name: (source, name) for name in ('app.js', 'tiny.css', 'logo.png')}))
+        storage.save_manifest()
+        self.names = storage.hashed_files
+
+    def exists(self, name):
+        return os.path.exists(os.path.join(self.root, name))
+
+    def test_precompresses_text_assets_only(self):
+        js = self.names['app.js']
+        self.assertTrue(self.exists(js + '.gz'))
+        self.assertEqual(self.exists(js + '.br'), middleware.brotli is not None)
+        self.assertFalse(self.exists(self.names['tiny.css'] + '.gz'))  # Under PRECOMPRESS_MIN_SIZE
+        self.assertFalse(self.exists(self.names['logo.png'] + '.gz'))
+
+    def test_manifest_is_strict(self):
+        storage = CompressedManifestStaticFilesStorage(location=self.root, base_url='/static/')
+        self.assertEqual(storage.url('app.js'), '/static/' + self.names['app.js'])
+        with self.assertRaises(ValueError):
+            storage.url('missing.js')
+
+    def test_serve_picks_variant_and_caching(self):
+        js = self.names['app.js']
+        with self.settings(STATIC_ROOT=self.root):
+            response = staticserve.serve(RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip'), js)
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Cache-Control'], staticserve.IMMUTABLE)
+            self.assertIn('Accept-Encoding', response['Vary'])
+            with open(os.path.join(self.root, js), 'rb') as f:
+                self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), f.read())
+            response.close()
+
+            repeat = staticserve.serve(
+                RequestFactory().get('/', HTTP_ACCEPT_ENCODING='gzip', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']),
+                js,
+            )
+            self.assertEqual(repeat.status_code, 304)
+
+            plain = staticserve.serve(RequestFactory().get('/'), js)
+            self.assertFalse(plain.has_header('Content-Encoding'))
+            plain.close()
+            manifest = staticserve.serve(RequestFactory().get('/'), 'staticfiles.json')
+            self.assertEqual(manifest['Cache-Control'], staticserve.REVALIDATE)  # Not fingerprinted
+            manifest.close()
+
+
+def middleware_probe(request):
+    """Which per-request middleware work ran for this request"""
+    return JsonResponse({'session': hasattr(request, 'session'), 'user': hasattr(request, 'user')})
+
+
+urlpatterns = [
+    path('fast/probe/', middleware_probe),
+    path('fast/full/', full_stack(lambda request: middleware_probe(request))),
+    path('slow/probe/', middleware_probe),
+]
+
+
+@override_settings(ROOT_URLCONF='base.tests', FAST_LANE_PREFIXES=('/fast/',))
+class FastLaneTests(SimpleTestCase):
+    def setUp(self):
+        self.client = Client(enforce_csrf_checks=True)
+
+    def test_prefixed_paths_skip_session_auth_csrf_and_clickjacking(self):
+        response = self.client.post('/fast/probe/')  # No CSRF token
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'session': False, 'user': False})
+        self.assertFalse(response.has_header('X-Frame-Options'))
+
+    def test_full_stack_opts_back_in(self):
+        self.assertEqual(self.client.post('/fast/full/').status_code, 403)
+        response = self.client.get('/fast/full/')
+        self.assertEqual(response.json(), {'session': True, 'user': True})
+        self.assertTrue(response.has_header('X-Frame-Options'))
+
+    def test_other_paths_are_untouched(self):
+        self.assertEqual(self.client.post('/slow/probe/').status_code, 403)
+        response = self.client.get('/slow/probe/')
+        self.assertEqual(response.json(), {'session': True, 'user': True})
+        self.assertTrue(response.has_header('X-Frame-Options'))
+
+
+class RateLimitTests(TestCase):
+    def setUp(self):
+        throttling._backend = None
+        self.addCleanup(setattr, throttling, '_backend', None)
+
+    def test_parse_rate(self):
+        self.assertEqual(throttling.parse_rate('30/m'), (30, 60.0))
+        self.assertEqual(throttling.parse_rate('10/15s'), (10, 15.0))
+        with self.assertRaises(ValueError):
+            throttling.parse_rate('30 per minute')
+
+    @mock.patch('base.throttling.time.monotonic')
+    def test_bucket_refills(self, now):
+        backend = throttling.MemoryBackend()
+        now.return_value = 100.0
+        self.assertEqual([backend.consume('k', 2, 1.0) for _ in range(3)], [0, 0, 1.0])
+        now.return_value = 100.5
+        self.assertEqual(backend.consume('k', 2, 1.0), 0.5)
+        now.return_value = 101.0
+        self.assertEqual(backend.consume('k', 2, 1.0), 0)
+
+    @mock.patch('base.throttling.time.monotonic')
+    def test_full_table_keeps_live_buckets(self, now):
+        backend = throttling.MemoryBackend()
+        backend.max_keys = 2
+        now.return_value = 100.0
+        backend.consume('a', 5, 1.0)
+        backend.consume('b', 5, 1.0)
+        self.assertGreater(backend.consume('c', 5, 1.0), 0)
+        self.assertEqual(set(backend.buckets), {'a', 'b'})
+
+        now.return_value = 102.0  # Both buckets are full again
+        self.assertEqual(backend.consume('c', 5, 1.0), 0)
+        self.assertEqual(set(backend.buckets), {'c'})
+
+    def test_send_is_limited_per_uid_and_per_ip(self):
+        room = Room.objects.create(name='Limited', room_code='LIMIT1')
+
+        def send(uid):
+            body = {'room_id': room.id, 'sender_name': uid, 'sender_uid': uid, 'message': 'hi'}
+            return self.client.post('/chat/send/', json.dumps(body), content_type='application/json')
+
+        statuses = [send('same').status_code for _ in range(11)]
+        self.assertEqual(statuses, [200] * 10 + [429])
+
+        # Rotating the uid still runs into the per-IP limit (burst 20)
+        statuses = [send(f'u{i}').status_code for i in range(11)]
+        self.assertEqual(statuses, [200] * 10 + [429])
+        response = send('another')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 1)
+
+    def test_room_key_matches_the_view(self):
+        room = Room.objects.create(name='Padded', room_code='PAD001')
+
+        def send(room_id):
+            body = {'room_id': room_id, 'sender_name': 'a', 'sender_uid': 'same', 'message': 'hi'}
+            return self.client.post('/chat/send/', json.dumps(body), content_type='application/json').status_code
+
+        # '1', '01', '001'... are the same room to the view, so the same bucket
+        self.assertEqual([send(str(room.id).zfill(i + 1)) for i in range(11)], [200] * 10 + [429])
+
+        def join(i):
+            # The view uses room_name first; a junk room_code must not change the key
+            body = {'room_name': room.room_code, 'room_code': f'junk{i}', 'UID': 'u1', 'name': 'a'}
+            return self.client.post('/create_member/', json.dumps(body), content_type='application/json').status_code
+
+        self.assertEqual([join(i) for i in range(31)], [200] * 30 + [429])
+
+    def test_plain_ip_limit(self):
+        # Every request a different room and uid; only the IP is shared (burst 40)
+        statuses = [
+            self.client.post('/chat/send/', json.dumps({
+                'room_id': 1000 + i, 'sender_name': 'a', 'sender_uid': f'u{i}', 'message': 'hi'
+            }), content_type='application/json').status_code
+            for i in range(41)
+        ]
+        self.assertEqual(statuses, [404] * 40 + [429])
+
+    @mock.patch('base.throttling.time.time', return_value=1000.0)
+    def test_cache_backend_admits_capacity_under_concurrency(self, now):
+        backend = throttling.CacheBackend()
+        results = []
+
+        def worker():
+            results.extend(backend.consume('shared', 10, 1.0) for _ in range(5))
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results.count(0), 10)
+        self.assertEqual(max(results), 10.0)  # Next window opens at 1010
+
+        now.return_value = 1010.0
+        self.assertEqual(backend.consume('shared', 10, 1.0), 0)
+
+
+class UserImportTests(TestCase):
+    def test_import_skips_existing_duplicate_and_invalid_rows(self):
+        User.objects.create_user('alice', password='pw')
+        body = 'username,password\nalice,x\nbob,secret\nbob,again\n,nameless\ncarol,secret\n'
+        result = self.client.post('/users/import/', body, content_type='text/csv').json()
+        self.assertEqual(result['created'], 2)
+        self.assertEqual(sorted(result['skipped']), ['alice', 'bob'])
+        self.assertEqual(result['errors'], [{'row': 4, 'message': 'username required'}])
+        self.assertTrue(User.objects.get(username='carol').check_password('secret'))
+
+    def test_api_caps_rows_and_plain_passwords(self):
+        plain = ''.join(f'user{i},pw\n' for i in range(views.IMPORT_MAX_PLAIN_PASSWORDS + 1))
+        response = self.client.post('/users/import/', 'username,password\n' + plain, content_type='text/csv')
+        self.assertEqual(response.status_code, 413)
+        self.assertFalse(User.objects.exists())
+
+        hashed = provisioning.hash_passwords(['pw'])[0]
+        body = ''.join(json.dumps({'username': f'user{i}', 'password_hash': hashed}) + '\n' for i in range(50))
+        result = self.client.post('/users/import/', body, content_type='application/x-ndjson').json()
+        self.assertEqual(result['created'], 50)
+
+    def test_concurrent_username_is_skipped(self):
+        hash_passwords = provisioning.hash_passwords
+
+        def race(passwords, pool=None, workers=1):
+            User.objects.create_user('dave', password='theirs')
+            return hash_passwords(passwords, pool, workers)
+
+        rows = [{'username': 'dave', 'password': 'mine'}, {'username': 'erin', 'password': 'mine'}]
+        with mock.patch.object(provisioning, 'hash_passwords', race):
+            result = provisioning.import_users(rows)
+        self.assertEqual((result['created'], result['skipped']), (1, ['dave']))
+        self.assertTrue(User.objects.get(username='dave').check_password('theirs'))
+
+    def test_user_pages_clamp_limit(self):
+        for name in ('u1', 'u2', 'u3'):
+            User.objects.create(username=name)
+        self.assertEqual(len(self.client.get('/users/?limit=0').json()['users']), 1)
+        self.assertEqual(len(self.client.get('/users/?limit=-5').json()['users']), 1)
+        page = self.client.get('/users/?limit=2').json()
+        rest = self.client.get(f"/users/?limit=2&after_id={page['next_after_id']}").json()
+        self.assertEqual([u['username'] for u in page['users'] + rest['users']], ['u1', 'u2', 'u3'])
+        self.assertIsNone(rest['next_after_id'])
+
+
+class ColdStartTests(SimpleTestCase):
+    """Guards against import-time regressions in the serverless entry points"""
+
+    def test_api_entry_point_skips_lazy_and_slimmed_modules(self):
+        api = coldstart.measure('mychat.wsgi_api', runs=1)['modules']
+        for module in coldstart.LAZY_MODULES + coldstart.SLIM_EXCLUDED:
+            self.assertNotIn(module, api)
+        full = coldstart.measure('mychat.wsgi', runs=1)['modules']
+        self.assertEqual([m for m in api if m not in full], ['mychat.settings_api', 'mychat.urls_api', 'mychat.wsgi_api'])
+
+    def test_api_profile_copies_templates(self):
+        from mychat import settings as full_settings, settings_api
+
+        self.assertEqual(settings_api.TEMPLATES[0]['OPTIONS']['context_processors'], [
+            'django.template.context_processors.request',
+        ])
+        self.assertIn(
+            'django.contrib.messages.context_processors.messages',
+            full_settings.TEMPLATES[0]['OPTIONS']['context_processors'],
+        )
+
+    def test_full_entry_point_skips_lazy_modules(self):
+        result = coldstart.measure('mychat.wsgi', runs=1)
+        for module in coldstart.LAZY_MODULES:
+            self.assertNotIn(module, result['modules'])
+
+
+class MessageBufferTests(TestCase):
+    def setUp(self):
+        get_buffer().clear()
+        self.addCleanup(get_buffer().clear)
+        self.room = Room.objects.create(name='Buffered', room_code='BUFF01')
+
+    @staticmethod
+    def message(i):
+        return {'id': i, 'sender_name': 'a', 'sender_uid': 'u1', 'message': str(i), 'created_at': None, 'is_edited': False}
+
+    def test_hits_misses_and_stale_primes(self):
+        buffer = RecentMessages(per_room=3)
+        self.assertIsNone(buffer.read(1, 2))
+
+        token = buffer.load_token()
+        buffer.append(1, self.message(5))  # A write after the read began
+        self.assertFalse(buffer.prime(1, 'r', [self.message(4)], False, token))
+
+        self.assertTrue(buffer.prime(1, 'r', [self.message(i) for i in range(1, 5)], False, buffer.load_token()))
+        self.assertEqual([m['id'] for m in buffer.read(1, 3)[1]], [2, 3, 4])
+        self.assertIsNone(buffer.read(1, 4))  # More than the window, and older rows exist
+        self.assertEqual(
+            {k: buffer.stats()[k] for k in ('hits', 'misses', 'rejected_primes')},
+            {'hits': 1, 'misses': 2, 'rejected_primes': 1},
+        )
+
+    def test_evicts_least_recently_used(self):
+        buffer = RecentMessages(per_room=3, max_rooms=2)
+        for room_id in (1, 2):
+            buffer.prime(room_id, 'r', [self.message(1)], True, buffer.load_token())
+        buffer.read(1, 1)
+        buffer.prime(3, 'r', [self.message(1)], True, buffer.load_token())
+        self.assertEqual(list(buffer.rooms), [1, 3])
+
+        buffer = RecentMessages(per_room=3, max_bytes=1000)
+        buffer.prime(1, 'r', [self.message(1), self.message(2)], True, buffer.load_token())
+        buffer.prime(2, 'r', [self.message(1), self.message(2)], True, buffer.load_token())
+        self.assertEqual((list(buffer.rooms), buffer.stats()['evictions']), ([2], 1))
+
+    def test_writes_from_other_processes_are_not_served_stale(self):
+        url = f'/chat/messages/?room_id={self.room.id}&limit=10'
+        first = ChatMessage.objects.create(room=self.room, sender_name='a', sender_uid='u1', message='one')
+        self.client.get(url)
+
+        # Writes that bypass this process's buffer, as another worker's would
+        ChatMessage.objects.create(room=self.room, sender_name='b', sender_uid='u2', message='two')
+        self.assertEqual([m['message'] for m in self.client.get(url).json()['messages']], ['one', 'two'])
+        ChatMessage.objects.filter(id=first.id).update(message='uno', is_edited=True, edited_at=timezone.now())
+        self.assertEqual([m['message'] for m in self.client.get(url).json()['messages']], ['uno', 'two'])
+        self.assertEqual(get_buffer().stats()['stale_reads'], 2)
+
+        # This process's own writes keep the window current
+        self.client.post('/chat/send/', json.dumps({
+            'room_id': self.room.id, 'sender_name': 'a', 'sender_uid': 'u1', 'message': 'three'
+        }), content_type='application/json')
+        self.client.post('/chat/edit/', json.dumps({'message_id': first.id, 'message': 'eins'}), content_type='application/json')
+        self.assertEqual([m['message'] for m in self.client.get(url).json()['messages']], ['eins', 'two', 'three'])
+        self.assertEqual(get_buffer().stats()['stale_reads'], 2)
+
+    def test_limit_must_be_positive(self):
+        for limit in ('0', '-1'):
+            response = self.client.get(f'/chat/messages/?room_id={self.room.id}&limit={limit}')
+            self.assertEqual(response.status_code, 400)
+
+
+class EventBusTests(SimpleTestCase):
+    ROOM = 9001  # No real room; the process bus also receives these events
+
+    def setUp(self):
+        get_buffer().clear()
+        self.addCleanup(get_buffer().clear)
+
+    def bus(self, window_ms, batch_size=200):
+        bus = events.EventBus({'BACKEND': 'memory', 'BATCH_WINDOW_MS': window_ms, 'BATCH_SIZE': batch_size})
+        bus.received = []
+        bus.delivered = threading.Event()
+        bus.subscribe(lambda batch: (bus.received.append(batch), bus.delivered.set()))
+        return bus
+
+    def event(self, bus, kind, **data):
+        return {'room_id': self.ROOM, 'type': kind, 'data': data, 'origin': bus.origin}
+
+    def test_chunks_fit_the_payload_limit(self):
+        batch = [{'type': events.MESSAGE_CREATED, 'data': {'id': i, 'message': 'x' * 1000}} for i in range(20)]
+        payloads = list(events._chunks(batch))
+        self.assertGreater(len(payloads), 1)
+        self.assertTrue(all(len(p.encode()) <= events.MAX_PAYLOAD for p in payloads))
+        self.assertEqual([e['data']['id'] for p in payloads for e in json.loads(p)], list(range(20)))
+
+        # 2000 CJK characters escape to over 12000 bytes; the event is cut to its id
+        big = {'type': events.MESSAGE_CREATED, 'data': {'id': 7, 'message': '\u5b57' * 2000}}
+        [payload] = events._chunks([big])
+        self.assertEqual(json.loads(payload)[0]['data'], {'id': 7})
+
+    def test_batches_go_to_other_buses_only(self):
+        sender, peer = self.bus(50), self.bus(50)
+        for i in range(3):
+            sender.enqueue(self.event(sender, events.MESSAGE_DELETED, id=i))
+        self.assertTrue(peer.delivered.wait(5))
+        self.assertEqual([[e['data']['id'] for e in batch] for batch in peer.received], [[0, 1, 2]])
+        self.assertEqual(sender.received, [])
+
+        thread = sender.sender
+        peer.delivered.clear()
+        sender.enqueue(self.event(sender, events.MESSAGE_DELETED, id=3))
+        self.assertTrue(peer.delivered.wait(5))
+        self.assertIs(sender.sender, thread)  # One long-lived sender, not a thread per batch
+
+    def test_full_batch_skips_the_window(self):
+        sender, peer = self.bus(60000, batch_size=2), self.bus(0)
+        sender.enqueue(self.event(sender, events.MESSAGE_DELETED, id=1))
+        sender.enqueue(self.event(sender, events.MESSAGE_DELETED, id=2))
+        self.assertTrue(peer.delivered.wait(5))
+        self.assertEqual(len(peer.received[0]), 2)
+
+    def test_apply_events_mirrors_peer_writes(self):
+        buffer = get_buffer()
+        rows = [
+            {'id': i, 'sender_name': 'a', 'sender_uid': 'u1', 'message': str(i),
+             'created_at': timezone.now(), 'is_edited': False, 'edited_at': None}
+            for i in (1, 2)
+        ]
+        buffer.prime(self.ROOM, 'r', rows, True, buffer.load_token())
+        now = timezone.now().isoformat()
+        apply_events([
+            {'room_id': self.ROOM, 'type': events.MESSAGE_CREATED, 'data': {
+                'id': 3, 'sender_name': 'b', 'sender_uid': 'u2', 'message': '3',
+                'created_at': now, 'is_edited': False, 'edited_at': None,
+            }},
+            {'room_id': self.ROOM, 'type': events.MESSAGE_EDITED, 'data': {'id': 1, 'message': 'one', 'edited_at': now}},
+            {'room_id': self.ROOM, 'type': events.MESSAGE_DELETED, 'data': {'id': 2}},
+        ])
+        self.assertEqual([m['message'] for m in buffer.read(self.ROOM, 10)[1]], ['one', '3'])
+
+        # An event cut down to its id drops the room instead
+        apply_events([{'room_id': self.ROOM, 'type': events.MESSAGE_CREATED, 'data': {'id': 4}}])
+        self.assertIsNone(buffer.read(self.ROOM, 10))
+
+        # A gap (events possibly lost) drops every window
+        buffer.prime(self.ROOM, 'r', rows, True, buffer.load_token())
+        apply_events([{'room_id': None, 'type': events.BUS_GAP, 'data': {}, 'origin': None}])
+        self.assertIsNone(buffer.read(self.ROOM, 10))
+
+    def test_socket_backend(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        config = {'BACKEND': 'socket', 'SOCKET_DIR': tmp.name, 'BATCH_WINDOW_MS': 0, 'BATCH_SIZE': 200}
+        sender, peer = events.EventBus(config), events.EventBus(config)
+        self.assertTrue(sender.backend.shared)
+        received = []
+        delivered = threading.Event()
+        peer.subscribe(lambda batch: (received.extend(batch), delivered.set()))
+
+        # A socket left behind by a worker that exited
+        dead = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        dead.bind(os.path.join(tmp.name, 'gone.sock'))
+        dead.close()
+
+        sender.enqueue(self.event(sender, events.MESSAGE_DELETED, id=1))
+        self.assertTrue(delivered.wait(5))
+        self.assertEqual([e['data'] for e in received], [{'id': 1}])
+        self.assertFalse(os.path.exists(os.path.join(tmp.name, 'gone.sock')))
+
+    def test_postgres_listener_reports_gaps(self):
+        listening = []
+        done = threading.Event()
+        conn = mock.MagicMock(notifies=[])
+
+        def connect(**params):
+            if len(listening) == 2:
+                done.set()
+                raise SystemExit  # Ends the listener thread
+            return conn
+
+        def select_(*args):
+            listening.append(bus.backend.shared)
+            raise OSError('connection lost')
+
+        fake_psycopg2 = mock.Mock(connect=connect, Error=Exception)
+        gaps = []
+        with mock.patch.dict('sys.modules', psycopg2=fake_psycopg2), \
+                mock.patch.object(events.select, 'select', select_), \
+                mock.patch.object(events.PostgresBackend, 'retry_delay', 0), \
+                self.assertLogs('base.events', 'ERROR'):
+            bus = events.EventBus({'BACKEND': 'postgres', 'CHANNEL': 'test', 'BATCH_WINDOW_MS': 0, 'BATCH_SIZE': 200})
+            bus.subscribe(lambda batch: gaps.extend(e for e in batch if e['type'] == events.BUS_GAP))
+            self.assertTrue(done.wait(5))
+        # Shared only while LISTEN was up, and a gap after every (re)connect
+        self.assertEqual(listening, [True, True])
+        self.assertFalse(bus.backend.shared)
+        self.assertEqual(len(gaps), 2)
+
+
+class ReadMarkerTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name='Marked', room_code='MARK01', max_members=1)
+        self.ids = [
+            ChatMessage.objects.create(room=self.room, sender_name='a', sender_uid=uid, message='m').id
+            for uid in ('u1', 'u2', 'u2', 'u2')
+        ]
+
+    def mark(self, uid, message_id, name=None):
+        body = {'room_id': self.room.id, 'uid': uid, 'message_id': message_id, 'name': name}
+        return self.client.post('/chat/read/', json.dumps(body), content_type='application/json')
+
+    def test_marks_only_move_forward(self):
+        member = RoomMember.objects.create(room=self.room, name='u1', uid='u1')
+        self.mark('u1', self.ids[2])
+        self.mark('u1', self.ids[1])
+        member.refresh_from_db()
+        self.assertEqual(member.last_read_message_id, self.ids[2])
+
+        rooms = self.client.get('/chat/unread/?uid=u1').json()['rooms']
+        self.assertEqual([(r['room_id'], r['unread']) for r in rooms], [(self.room.id, 1)])
+
+    def test_readers_do_not_take_seats(self):
+        self.mark('reader', self.ids[0], name='Reader')
+        reader = RoomMember.objects.get(uid='reader')
+        self.assertEqual((reader.is_active, reader.last_read_message_id), (False, self.ids[0]))
+        # A reader's marks still drive its unread badges
+        rooms = self.client.get('/chat/unread/?uid=reader').json()['rooms']
+        self.assertEqual([(r['room_id'], r['unread']) for r in rooms], [(self.room.id, 3)])
+
+        response = self.client.post('/rooms/members/add/', json.dumps({
+            'room_id': self.room.id, 'name': 'Joiner', 'uid': 'joiner'
+        }), content_type='application/json')
+        self.assertEqual(response.json()['status'], 'success')
+
+
+class QueryPlanTests(TestCase):
+    """Every query the JSON views issue must be served by an index"""
+
+    def test_views_avoid_sequential_scans(self):
+        cache.set('queryplans-test', 1)
+        for result in queryplans.audit(rooms=20, members=10, messages=20):
+            self.assertLess(result['status'], 400, result['view'])
+            for query in result['queries']:
+                self.assertEqual(
+                    query['seq_scans'], [],
+                    f"{result['view']}: {query['sql']}\n" + '\n'.join(query['plan']),
+                )
+        self.assertEqual(cache.get('queryplans-test'), 1)  # The audit clears only its own cache
+
+
+class ReaperTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name='Idle', room_code='IDLE01')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=self.room, sender_name='a', sender_uid='u1', message=str(i)) for i in range(25)
+        ])
+        RoomMember.objects.create(room=self.room, name='a', uid='u1', is_active=False)  # Left long ago
+        self.age(days=60)
+
+    def age(self, days):
+        past = timezone.now() - timedelta(days=days)
+        ChatMessage.objects.filter(room=self.room).update(created_at=past)
+        RoomMember.objects.filter(room=self.room).update(joined_at=past)
+        Room.objects.filter(id=self.room.id).update(updated_at=past)
+
+    def deactivated(self, days_ago):
+        Room.objects.filter(id=self.room.id).update(deactivated_at=timezone.now() - timedelta(days=days_ago))
+
+    def test_recent_message_keeps_room_active(self):
+        ChatMessage.objects.create(room=self.room, sender_name='a', sender_uid='u1', message='still here')
+        self.assertEqual(reaper.deactivate_idle(idle_days=30), [])
+
+    def test_deactivate_then_purge_in_chunks(self):
+        self.assertEqual(reaper.deactivate_idle(idle_days=30), [self.room.id])
+        self.assertFalse(Room.objects.get(id=self.room.id).is_active)
+        # Still inside the grace period
+        self.assertEqual(reaper.purge_inactive(purge_days=7), {})
+
+        self.deactivated(days_ago=10)
+        purged = reaper.purge_inactive(purge_days=7, chunk_size=10)
+        self.assertEqual(purged[self.room.id]['base_chatmessage'], 25)
+        self.assertEqual(purged[self.room.id]['base_roommember'], 1)
+        self.assertFalse(Room.objects.filter(id=self.room.id).exists())
+        self.assertFalse(ChatMessage.objects.filter(room_id=self.room.id).exists())
+
+    def test_members_keep_room_active(self):
+        # A call-only room: no messages, but someone is in it
+        member = RoomMember.objects.create(room=self.room, name='b', uid='u2')
+        self.assertEqual(reaper.deactivate_idle(idle_days=30), [])
+
+        RoomMember.objects.filter(id=member.id).update(is_active=False)  # Left today
+        self.assertEqual(reaper.deactivate_idle(idle_days=30), [])
+
+    def test_join_after_deactivation_keeps_room(self):
+        reaper.deactivate_idle(idle_days=30)
+        self.deactivated(days_ago=10)
+        RoomMember.objects.create(room=self.room, name='b', uid='u2', is_active=False)
+        self.assertEqual(reaper.purge_inactive(purge_days=7), {})
+
+    def test_message_after_deactivation_keeps_room(self):
+        reaper.deactivate_idle(idle_days=30)
+        self.deactivated(days_ago=10)
+        ChatMessage.objects.create(room=self.room, sender_name='a', sender_uid='u1', message='anyone?')
+        self.assertEqual(reaper.purge_inactive(purge_days=7), {})
+
+    def test_only_reaper_deactivations_are_purged(self):
+        Room.objects.filter(id=self.room.id).update(is_active=False)
+        self.assertEqual(reaper.purge_inactive(purge_days=7), {})
+
+        reaper.deactivate_idle(idle_days=30)
+        self.deactivated(days_ago=10)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.client.post('/admin/base/room/', {'action': 'deactivate_rooms', '_selected_action': [self.room.id]})
+        self.assertIsNone(Room.objects.get(id=self.room.id).deactivated_at)
+        self.assertEqual(reaper.purge_inactive(purge_days=7), {})
+
+
+class AdminTests(TestCase):
+    def setUp(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'pw'))
+        self.room = Room.objects.create(name='Busy', room_code='BUSY01')
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=self.room, sender_name='a', sender_uid='u1', message=str(i)) for i in range(150)
+        ])
+
+    def test_changelist_pages_by_key(self):
+        newest = ChatMessage.objects.order_by('-id')
+        response = self.client.get('/admin/base/chatmessage/')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, f'?after={newest[99].id}')
+
+        response = self.client.get(f'/admin/base/chatmessage/?after={newest[99].id}')
+        self.assertEqual([m.id for m in response.context['cl'].result_list], [m.id for m in newest[100:]])
+
+    def test_bulk_actions(self):
+        ids = list(ChatMessage.objects.values_list('id', flat=True)[:3])
+        self.client.post('/admin/base/chatmessage/', {'action': 'redact_messages', '_selected_action': ids})
+        self.assertEqual(set(ChatMessage.objects.filter(id__in=ids).values_list('is_edited', flat=True)), {True})
+
+        self.client.post('/admin/base/chatmessage/', {'action': 'delete_selected', '_selected_action': ids, 'post': 'yes'})
+        self.assertEqual(ChatMessage.objects.count(), 147)
+
+    def test_room_delete_is_left_to_the_reaper(self):
+        self.client.post(f'/admin/base/room/{self.room.id}/delete/', {'post': 'yes'})
+        self.room.refresh_from_db()
+        self.assertFalse(self.room.is_active)
+        self.assertIsNotNone(self.room.delete_requested_at)
+        self.assertEqual(ChatMessage.objects.count(), 150)
+
+        self.assertEqual(list(reaper.purge_inactive(purge_days=7)), [self.room.id])
+        self.assertFalse(Room.objects.filter(id=self.room.id).exists())
+        self.assertEqual(ChatMessage.objects.count(), 0)
+
+    def test_reactivating_cancels_delete(self):
+        self.client.post('/admin/base/room/', {
+            'action': 'delete_selected', '_selected_action': [self.room.id], 'post': 'yes',
+        })
+        self.room.refresh_from_db()
+        self.assertIsNotNone(self.room.delete_requested_at)
+
+        data = {
+            'name': self.room.name, 'room_code': self.room.room_code, 'share_link_id': self.room.share_link_id,
+            'is_active': 'on', 'max_members': self.room.max_members,
+        }
+        self.client.post(f'/admin/base/room/{self.room.id}/change/', data)
+        self.room.refresh_from_db()
+        self.assertTrue(self.room.is_active)
+        self.assertIsNone(self.room.delete_requested_at)
+        self.assertEqual(reaper.purge_inactive(purge_days=7), {})
+
+
+class ActivityTests(TestCase):
+    def setUp(self):
+        self.room = Room.objects.create(name='Lively', room_code='LIVE01')
+
+    def test_write_paths_maintain_rollups(self):
+        for uid in ('u1', 'u2', 'u3'):
+            RoomMember.objects.create(room=self.room, name=uid, uid=uid)
+            activity.record_members(self.room.id)
+        RoomMember.objects.filter(uid='u3').update(is_active=False)
+        activity.record_members(self.room.id)
+        for _ in range(4):
+            activity.record_message(self.room.id)
+
+        stats = activity.room_stats([self.room.id], hours=2)[self.room.id]
+        self.assertEqual(stats['messages'], 4)
+        self.assertEqual(stats['messages_per_hour'], 2)
+        self.assertEqual(stats['peak_members'], 3)
+        self.assertIsNotNone(stats['last_activity_at'])
+
+    def test_compact_backfills_finished_hours(self):
+        past = timezone.now() - timedelta(hours=3)
+        ChatMessage.objects.bulk_create([
+            ChatMessage(room=self.room, sender_name='a', sender_uid='u1', message=str(i)) for i in range(5)
+        ])
+        ChatMessage.objects.update(created_at=past)
+
+        self.assertEqual(activity.compact(hours=24), (1, 0))
+        self.assertEqual(activity.room_stats(hours=24)[self.room.id]['messages'], 5)
+
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings = override_settings(PROFILING={'ENABLED': True, 'DIR': directory.name, 'MAX_PROFILES': 2})
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.room = Room.objects.create(name='Profiled', room_code='PROF01')
+        self.url = f'/chat/messages/?room_id={self.room.id}'
+
+    def test_signed_header_records_profile(self):
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url))
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE='forged'))
+        self.assertNotIn('X-Profile-Id', self.client.get(self.url, HTTP_X_PROFILE=profiling.make_token(-1)))
+
+        response = self.client.get(self.url, HTTP_X_PROFILE=profiling.make_token())
+        record = profiling.get_store().get(response['X-Profile-Id'])
+        self.assertEqual((record['trigger'], record['path'], record['status']), ('header', '/chat/messages/', 200))
+        self.assertIn('cumulative', record['report'])
+        self.assertEqual(record['sql_count'], len(record['sql']))
+        self.assertTrue(record['sql'])
+
+    def test_staff_flag_sampling_and_ring(self):
+        self.client.get('/rooms/?_profile=1')
+        self.assertEqual(profiling.get_store().summaries(), [])
+        self.assertEqual(self.client.get('/profiles/').status_code, 403)
+
+        self.client.force_login(User.objects.create_user('ops', password='pw', is_staff=True))
+        with self.settings(PROFILING={**profiling.get_config(), 'ENGINE': 'sampling', 'SAMPLE_INTERVAL_MS': 0.1}):
+            self.client.handler.load_middleware()
+            ids = [self.client.get('/rooms/?_profile=1')['X-Profile-Id'] for _ in range(3)]
+
+        listing = self.client.get('/profiles/').json()['profiles']
+        self.assertEqual([row['id'] for row in listing], ids[:0:-1])
+        stacks = self.client.get(f'/profiles/{ids[-1]}/?format=collapsed')
+        self.assertEqual(stacks['Content-Type'], 'text/plain; charset=utf-8')
+        self.assertEqual(self.client.get(f'/profiles/{ids[0]}/').status_code, 404)
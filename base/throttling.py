@@ -0,0 +1,224 @@
+"""Token-bucket rate limiting for the JSON endpoints.
+
+Usage::
+
+    @csrf_exempt
+    @ratelimit('240/m', key='ip', scope='send_chat_message_ip_total')
+    @ratelimit('30/m', key=('sender_uid', 'room_id'))
+    def send_chat_message(request): ...
+
+Keys are joined, so a client that can choose a key part (``sender_uid``) can
+rotate it to get fresh buckets. Key parts are read the way the view reads
+them (``room_id`` as an int, the room code the view looks up), so padding or
+extra fields don't help, but every view also carries a plain ``ip`` limit
+that no part of the request can change.
+
+A rate is ``<count>/<period>`` where period is ``s``, ``m``, ``h`` or ``d``,
+optionally with a multiplier (``10/15s``). Buckets hold ``burst`` tokens
+(default ``count``) and refill at ``count / period`` tokens per second.
+Over-limit requests get ``429`` with ``Retry-After``.
+
+Settings:
+    RATELIMIT_ENABLE            turn limiting off entirely (default True)
+    RATELIMIT_BACKEND           'memory' (per process) or 'cache' (shared)
+    RATELIMIT_CACHE             cache alias for the 'cache' backend
+    RATELIMIT_RATES             {scope: rate} overrides, scope = view name
+                                unless given
+    RATELIMIT_TRUST_FORWARDED   take the client IP from X-Forwarded-For
+"""
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.http import JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+re_rate = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """'30/m' -> (30, 60.0)"""
+    match = re_rate.match(rate)
+    if not match:
+        raise ValueError(f'Invalid rate: {rate!r}')
+    count, multiplier, unit = match.groups()
+    return int(count), float(int(multiplier or 1) * PERIODS[unit])
+
+
+class MemoryBackend:
+    """Per-process buckets in a dict; cheapest, but not shared across workers"""
+    max_keys = 10000
+
+    def __init__(self):
+        self.buckets = {}  # key -> (tokens, stamp, capacity, refill_per_sec)
+        self.lock = threading.Lock()
+        self.full_until = 0.0
+
+    def consume(self, key, capacity, refill_per_sec):
+        """Take one token; return 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        with self.lock:
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                tokens = min(capacity, bucket[0] + (now - bucket[1]) * refill_per_sec)
+            elif len(self.buckets) >= self.max_keys and not self.prune(now):
+                # Every tracked key is still limited: refuse new keys rather
+                # than forget limits someone is spraying keys to reset.
+                return self.full_until - now
+            else:
+                tokens = capacity
+            if tokens >= 1:
+                self.buckets[key] = (tokens - 1, now, capacity, refill_per_sec)
+                return 0
+            self.buckets[key] = (tokens, now, capacity, refill_per_sec)
+            return (1 - tokens) / refill_per_sec
+
+    def prune(self, now):
+        """Drop buckets that have refilled completely; True if any were dropped
+
+        A full bucket is exactly what a new key starts with, so forgetting it
+        never makes the limiter more lenient. When nothing is full, the table
+        isn't rescanned for a second (or until the first bucket fills).
+        """
+        if now < self.full_until:
+            return False
+        full = []
+        soonest = 1.0
+        for k, (tokens, stamp, capacity, refill_per_sec) in self.buckets.items():
+            wait = (capacity - tokens) / refill_per_sec - (now - stamp)
+            if wait <= 0:
+                full.append(k)
+            else:
+                soonest = min(soonest, wait)
+        for k in full:
+            del self.buckets[k]
+        if not full:
+            self.full_until = now + soonest
+        return bool(full)
+
+
+class CacheBackend:
+    """Counters in a Django cache, shared by every worker using that cache
+
+    A token bucket needs a read-modify-write, which a cache can't do
+    atomically, so here each key gets a fixed window as long as a full
+    refill (``capacity / refill_per_sec``) admitting ``capacity`` requests,
+    counted with ``add`` + ``incr``. That is atomic on memcached, redis and
+    locmem (not on the database or file caches). The average rate is the
+    same as the bucket's; across a window boundary up to twice ``capacity``
+    can get through.
+    """
+
+    def __init__(self, alias='default'):
+        from django.core.cache import caches
+        self.cache = caches[alias]
+
+    def consume(self, key, capacity, refill_per_sec):
+        window = capacity / refill_per_sec
+        now = time.time()
+        slot = int(now // window)
+        # Hash keys so uids/room names are always valid (memcached) cache keys.
+        key = 'rl:' + hashlib.blake2b(f'{key}:{slot}'.encode(), digest_size=16).hexdigest()
+        timeout = math.ceil(window) + 1
+        if self.cache.add(key, 1, timeout):
+            return 0
+        try:
+            used = self.cache.incr(key)
+        except ValueError:  # Expired between add() and incr()
+            self.cache.add(key, 1, timeout)
+            return 0
+        if used <= capacity:
+            return 0
+        return (slot + 1) * window - now
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        if getattr(settings, 'RATELIMIT_BACKEND', 'memory') == 'cache':
+            _backend = CacheBackend(getattr(settings, 'RATELIMIT_CACHE', 'default'))
+        else:
+            _backend = MemoryBackend()
+    return _backend
+
+
+# ==================== KEY FUNCTIONS ====================
+
+def _json_body(request):
+    """Parsed JSON body, cached on the request (views parse it again cheaply)"""
+    if not hasattr(request, '_ratelimit_json'):
+        try:
+            data = json.loads(request.body) if request.body else {}
+        except (ValueError, UnicodeDecodeError):
+            data = {}
+        request._ratelimit_json = data if isinstance(data, dict) else {}
+    return request._ratelimit_json
+
+
+def _body(request, *names):
+    """First non-empty ``names`` field of the JSON body, as the views read it"""
+    data = _json_body(request)
+    for name in names:
+        value = data.get(name)
+        if value:
+            return str(value)
+    return ''
+
+
+def _room_id(request):
+    """``room_id`` as the view looks it up, so '1' and '001' share a bucket"""
+    try:
+        return str(int(_json_body(request).get('room_id')))
+    except (TypeError, ValueError):
+        return ''
+
+
+def client_ip(request):
+    if getattr(settings, 'RATELIMIT_TRUST_FORWARDED', False):
+        forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+        if forwarded:
+            return forwarded.split(',')[0].strip()
+    return request.META.get('REMOTE_ADDR', '')
+
+
+KEY_FUNCTIONS = {
+    'ip': client_ip,
+    'sender_uid': lambda request: _body(request, 'sender_uid'),
+    'room_id': _room_id,
+    # createMember looks the room up by room_name first, then room_code
+    'room_code': lambda request: _body(request, 'room_name', 'room_code'),
+}
+
+
+def ratelimit(rate, key='ip', burst=None, scope=None):
+    """Limit a view to ``rate`` per ``key`` (a name, tuple of names or callable)"""
+    keys = (key,) if isinstance(key, str) or callable(key) else tuple(key)
+    key_funcs = [k if callable(k) else KEY_FUNCTIONS[k] for k in keys]
+
+    def decorator(view_func):
+        name = scope or view_func.__name__
+
+        @wraps(view_func)
+        def wrapped(request, *args, **kwargs):
+            if not getattr(settings, 'RATELIMIT_ENABLE', True):
+                return view_func(request, *args, **kwargs)
+
+            count, period = parse_rate(getattr(settings, 'RATELIMIT_RATES', {}).get(name, rate))
+            ident = ':'.join(func(request) for func in key_funcs)
+            retry_after = get_backend().consume(f'rl:{name}:{ident}', burst or count, count / period)
+            if retry_after:
+                response = JsonResponse({'status': 'error', 'message': 'Too many requests'}, status=429)
+                response['Retry-After'] = str(math.ceil(retry_after))
+                return response
+            return view_func(request, *args, **kwargs)
+        return wrapped
+    return decorator
@@ -13,6 +13,7 @@ urlpatterns = [
     # User Management Routes
     path('users/', views.get_users, name='get_users'),
     path('users/create/', views.create_user, name='create_user'),
+    path('users/import/', views.import_users, name='import_users'),
     path('users/update/', views.update_user, name='update_user'),
     path('users/delete/', views.delete_user, name='delete_user'),
     path('users/change-password/', views.change_password, name='change_password'),
@@ -22,17 +23,25 @@ urlpatterns = [
     path('rooms/', views.get_rooms, name='get_rooms'),
     path('rooms/create/', views.create_room, name='create_room'),
     path('rooms/by-code/', views.get_room_by_code, name='get_room_by_code'),
-    path('rooms/<str:share_link_id>/', views.get_room_by_share_link, name='get_room_by_share_link'),
-    path('join/<str:share_link_id>/', views.join_room, name='join_room'),
+    path('rooms/stats/', views.get_room_stats, name='get_room_stats'),
     path('rooms/members/add/', views.add_room_member, name='add_room_member'),
     path('rooms/members/', views.get_room_members, name='get_room_members'),
+    path('rooms/<str:share_link_id>/', views.get_room_by_share_link, name='get_room_by_share_link'),
+    path('join/<str:share_link_id>/', views.join_room, name='join_room'),
     path('rooms/members/remove/', views.remove_room_member, name='remove_room_member'),
     path('manage-rooms/', views.room_management, name='room_management'),
     
     # Chat Routes
     path('chat/room/<int:room_id>/', views.chat_room, name='chat_room'),
     path('chat/messages/', views.get_room_messages, name='get_room_messages'),
+    path('chat/buffer/stats/', views.get_buffer_stats, name='get_buffer_stats'),
     path('chat/send/', views.send_chat_message, name='send_chat_message'),
     path('chat/edit/', views.edit_chat_message, name='edit_chat_message'),
     path('chat/delete/', views.delete_chat_message, name='delete_chat_message'),
+    path('chat/read/', views.mark_read, name='mark_read'),
+    path('chat/unread/', views.get_unread_counts, name='get_unread_counts'),
+    
+    # Request profiles (staff only)
+    path('profiles/', views.list_profiles, name='list_profiles'),
+    path('profiles/<str:profile_id>/', views.get_profile, name='get_profile'),
 ]
\ No newline at end of file
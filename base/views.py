@@ -1,24 +1,35 @@
 from django.shortcuts import render
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
+from django.utils.http import http_date
+from django.views.decorators.cache import cache_control
 import random
 import time
-from agora_token_builder import RtcTokenBuilder
 from .models import RoomMember, ChatMessage, Room
+from .wire import COMPACT_FORMAT, pack_messages
+from .throttling import ratelimit
+from .message_buffer import fingerprint, get_buffer
+from . import activity, events, profiling
 import json
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 
 
 # Create your views here.
 
+@cache_control(no_cache=True)
 def lobby(request):
     return render(request, 'base/lobby.html')
 
+@cache_control(no_cache=True)
 def room(request):
     return render(request, 'base/room.html')
 
 
+@ratelimit('20/m', key='ip')
 def getToken(request):
     appId = "469fbdf3aafd4991b7ef2b24c3b21c04"
     appCertificate = "c0e02daffb9a438f8d74f5d79b5d2fd9"
@@ -29,12 +40,16 @@ def getToken(request):
     privilegeExpiredTs = currentTimeStamp + expirationTimeInSeconds
     role = 1
 
+    # Imported here so cold starts that never mint a token don't pay for it
+    from agora_token_builder import RtcTokenBuilder
     token = RtcTokenBuilder.buildTokenWithUid(appId, appCertificate, channelName, uid, role, privilegeExpiredTs)
 
     return JsonResponse({'token': token, 'uid': uid}, safe=False)
 
 
 @csrf_exempt
+@ratelimit('60/m', key='ip', scope='createMember_ip_total')
+@ratelimit('30/m', key=('ip', 'room_code'))
 def createMember(request):
     data = json.loads(request.body)
     try:
@@ -47,6 +62,14 @@ def createMember(request):
             uid=data['UID'],
             defaults={'name': data['name'], 'is_active': True}
         )
+        if not created and not member.is_active:
+            # A reader's marker row (see mark_read) or a member who left
+            member.is_active = True
+            member.save(update_fields=['is_active'])
+            created = True
+        if created:
+            activity.record_members(room.id)
+            events.publish(room.id, events.MEMBER_JOINED, uid=member.uid, name=member.name)
         
         return JsonResponse({'name': data['name'], 'status': 'success'}, safe=False)
     except Room.DoesNotExist:
@@ -55,6 +78,7 @@ def createMember(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400, safe=False)
 
 
+@cache_control(no_cache=True)
 def getMember(request):
     try:
         uid = request.GET.get('UID')
@@ -81,6 +105,8 @@ def deleteMember(request):
             room=room
         )
         member.delete()
+        activity.record_members(room.id)
+        events.publish(room.id, events.MEMBER_LEFT, uid=member.uid)
         return JsonResponse({'status': 'success', 'message': 'Member deleted'}, safe=False)
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400, safe=False)
@@ -89,19 +115,85 @@ def deleteMember(request):
 # ==================== USER MANAGEMENT API ====================
 
 from django.contrib.auth.models import User
-from django.contrib.auth import authenticate, login, logout
+
+USER_FIELDS = ('id', 'username', 'email', 'is_staff', 'is_active', 'is_superuser', 'date_joined')
+USER_PAGE_MAX = 1000
+
+
+def _stream_users(after_id):
+    """NDJSON lines for every user with id > after_id, read in keyset chunks"""
+    while True:
+        chunk = list(User.objects.filter(id__gt=after_id).order_by('id').values(*USER_FIELDS)[:USER_PAGE_MAX])
+        for user in chunk:
+            yield json.dumps(user, cls=DjangoJSONEncoder) + '\n'
+        if len(chunk) < USER_PAGE_MAX:
+            return
+        after_id = chunk[-1]['id']
+
 
 # Get all users
 @csrf_exempt
+@cache_control(no_cache=True)
 def get_users(request):
-    """API: Get all users"""
+    """API: Get users (all, one keyset page with ?limit=&after_id=, or ?stream=1 NDJSON)"""
     try:
-        users = User.objects.all().values('id', 'username', 'email', 'is_staff', 'is_active', 'is_superuser', 'date_joined')
+        after_id = int(request.GET.get('after_id', 0))
+        
+        if request.GET.get('stream'):
+            return StreamingHttpResponse(_stream_users(after_id), content_type='application/x-ndjson')
+        
+        if 'limit' in request.GET or 'after_id' in request.GET:
+            limit = min(max(int(request.GET.get('limit', 100)), 1), USER_PAGE_MAX)
+            users = list(User.objects.filter(id__gt=after_id).order_by('id').values(*USER_FIELDS)[:limit])
+            return JsonResponse({
+                'status': 'success',
+                'users': users,
+                'next_after_id': users[-1]['id'] if len(users) == limit else None
+            }, safe=False)
+        
+        users = User.objects.all().values(*USER_FIELDS)
         return JsonResponse({'status': 'success', 'users': list(users)}, safe=False)
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
+# Hashing runs in the request's worker at ~0.1 s per plain password, so calls
+# are capped; bigger loads go through `manage.py import_users`.
+IMPORT_MAX_ROWS = 5000
+IMPORT_MAX_PLAIN_PASSWORDS = 20
+
+
+# Bulk import users
+@csrf_exempt
+@ratelimit('5/m', key='ip')
+def import_users(request):
+    """API: Bulk-create users from a CSV or NDJSON body"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST method required'}, status=400)
+    
+    from . import provisioning  # csv + hashers, only needed here
+    
+    try:
+        fmt = request.GET.get('format') or ('csv' if 'csv' in request.content_type else 'ndjson')
+        rows = provisioning.parse_rows(request.body.decode('utf-8'), fmt)
+        plain = sum(1 for row in rows if not row.get('password_hash'))
+        if len(rows) > IMPORT_MAX_ROWS or plain > IMPORT_MAX_PLAIN_PASSWORDS:
+            return JsonResponse({
+                'status': 'error',
+                'message': f'At most {IMPORT_MAX_ROWS} rows and {IMPORT_MAX_PLAIN_PASSWORDS} plain passwords '
+                           'per request; use password_hash or `manage.py import_users` for more',
+            }, status=413)
+        result = provisioning.import_users(rows)
+        
+        return JsonResponse({
+            'status': 'success',
+            'message': f"{result['created']} users created",
+            **result
+        })
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
 # Create new user
 @csrf_exempt
 def create_user(request):
@@ -258,6 +350,7 @@ def change_password(request):
 
 
 # User management page
+@cache_control(no_cache=True)
 def user_management(request):
     """Render user management UI"""
     return render(request, 'base/user_management.html')
@@ -268,6 +361,8 @@ def user_management(request):
 from .models import Room
 import string
 
+ACTIVITY_MAX_HOURS = 24 * 7
+
 def generate_room_code():
     """Generate a unique 6-character room code"""
     while True:
@@ -278,6 +373,7 @@ def generate_room_code():
 
 # Create a new room
 @csrf_exempt
+@ratelimit('10/m', key='ip')
 def create_room(request):
     """API: Create a new room with unique share link"""
     if request.method != 'POST':
@@ -303,6 +399,7 @@ def create_room(request):
             description=description,
             max_members=max_members
         )
+        events.publish(room.id, events.ROOM_CHANGED)
         
         return JsonResponse({
             'status': 'success',
@@ -323,17 +420,21 @@ def create_room(request):
 
 # Get all rooms
 @csrf_exempt
+@cache_control(no_cache=True)
 def get_rooms(request):
     """API: Get all active rooms"""
     try:
+        # Member counts in the same query, off the active-member index
+        member_count = RoomMember.objects.filter(
+            room=OuterRef('pk'), is_active=True
+        ).order_by().values('room').annotate(count=Count('id')).values('count')
         rooms = Room.objects.filter(is_active=True).values(
             'id', 'name', 'room_code', 'share_link_id', 'description', 'max_members', 'created_at'
-        ).order_by('-created_at')
+        ).annotate(member_count=Coalesce(Subquery(member_count), 0)).order_by('-created_at')
         
         rooms_list = []
         for room in rooms:
             room['share_link'] = f'/join/{room["share_link_id"]}/'
-            room['member_count'] = RoomMember.objects.filter(room_id=room['id'], is_active=True).count()
             rooms_list.append(room)
         
         return JsonResponse({'status': 'success', 'rooms': rooms_list}, safe=False)
@@ -342,6 +443,7 @@ def get_rooms(request):
 
 
 # Get room by code
+@cache_control(no_cache=True)
 def get_room_by_code(request):
     """API: Get room details by room code"""
     try:
@@ -371,6 +473,7 @@ def get_room_by_code(request):
 
 
 # Get room by share link ID
+@cache_control(no_cache=True)
 def get_room_by_share_link(request, share_link_id):
     """API: Get room details by share link UUID"""
     try:
@@ -397,11 +500,14 @@ def get_room_by_share_link(request, share_link_id):
 
 # Join room
 @csrf_exempt
+@cache_control(no_cache=True)
 def join_room(request, share_link_id=None):
     """UI: Join room by share link"""
     try:
         room = Room.objects.get(share_link_id=share_link_id, is_active=True)
-        return render(request, 'base/join_room.html', {'room': room})
+        response = render(request, 'base/join_room.html', {'room': room})
+        response['Last-Modified'] = http_date(room.updated_at.timestamp())
+        return response
     except Room.DoesNotExist:
         return render(request, 'base/room_not_found.html', {'error': 'Room not found'}, status=404)
 
@@ -438,6 +544,10 @@ def add_room_member(request):
         if not created and not member.is_active:
             member.is_active = True
             member.save()
+            created = True
+        if created:
+            activity.record_members(room.id)
+            events.publish(room.id, events.MEMBER_JOINED, uid=member.uid, name=member.name)
         
         return JsonResponse({
             'status': 'success',
@@ -455,6 +565,7 @@ def add_room_member(request):
 
 
 # Get room members
+@cache_control(no_cache=True)
 def get_room_members(request):
     """API: Get all members in a room"""
     try:
@@ -495,6 +606,8 @@ def remove_room_member(request):
         member = RoomMember.objects.get(id=member_id)
         member.is_active = False
         member.save()
+        activity.record_members(member.room_id)
+        events.publish(member.room_id, events.MEMBER_LEFT, uid=member.uid)
         
         return JsonResponse({'status': 'success', 'message': 'Member removed from room'})
     except RoomMember.DoesNotExist:
@@ -503,7 +616,39 @@ def remove_room_member(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
+# Room activity stats (rollups only)
+@cache_control(no_cache=True)
+def get_room_stats(request):
+    """API: Messages/hour, peak members and last activity per room, from hourly rollups"""
+    try:
+        hours = min(max(int(request.GET.get('hours', 24)), 1), ACTIVITY_MAX_HOURS)
+        room_id = request.GET.get('room_id')
+        
+        if room_id:
+            room_id = int(room_id)
+            stats = activity.room_stats([room_id], hours)
+            return JsonResponse({
+                'status': 'success',
+                'hours': hours,
+                'room_id': room_id,
+                'stats': stats.get(room_id),
+                'buckets': activity.room_buckets(room_id, hours)
+            })
+        
+        stats = activity.room_stats(None, hours)
+        return JsonResponse({
+            'status': 'success',
+            'hours': hours,
+            'rooms': [{'room_id': room_id, **row} for room_id, row in stats.items()]
+        })
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'hours and room_id must be integers'}, status=400)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
 # Room management page
+@cache_control(no_cache=True)
 def room_management(request):
     """Render room management UI"""
     return render(request, 'base/room_management.html')
@@ -511,32 +656,101 @@ def room_management(request):
 
 # ==================== REAL-TIME CHAT (Socket.io) ====================
 
+MESSAGE_FIELDS = ('id', 'sender_name', 'sender_uid', 'message', 'created_at', 'is_edited', 'edited_at')
+# Longer bodies are left out of events; peers drop the room from their buffer instead.
+EVENT_MESSAGE_MAX = 2000
+
+
+def _serialize_message(msg):
+    """Same shape as ChatMessage.objects.values(*MESSAGE_FIELDS)"""
+    return {field: getattr(msg, field) for field in MESSAGE_FIELDS}
+
+
+def _message_event(msg, *fields):
+    """Event payload for ``msg``: its id plus ``fields`` when the body is small enough"""
+    data = {'id': msg.id}
+    if len(msg.message) <= EVENT_MESSAGE_MAX:
+        data.update((field, getattr(msg, field)) for field in fields)
+        for field in ('created_at', 'edited_at'):
+            if data.get(field):
+                data[field] = data[field].isoformat()
+    return data
+
+
+def _load_messages(room_id, limit, before_id):
+    """(room_name, messages oldest-first) for one page, served from the buffer when possible"""
+    buffer = get_buffer()
+    first_page = limit and not before_id and limit <= buffer.per_room
+    if first_page:
+        # Without a shared event bus, other workers' writes never reach this
+        # buffer, so each hit is checked against the (room, id) index.
+        cached = buffer.read(room_id, limit, None if events.is_shared() else fingerprint)
+        if cached:
+            return cached
+    
+    token = buffer.load_token()
+    room = Room.objects.get(id=room_id)
+    messages = ChatMessage.objects.filter(room=room)
+    if before_id:
+        messages = messages.filter(id__lt=before_id)
+    
+    if not limit:
+        return room.name, list(messages.values(*MESSAGE_FIELDS).order_by('created_at'))
+    
+    # A first-page miss reads a whole buffer window so the next read hits.
+    window = buffer.per_room if first_page else limit
+    rows = list(messages.values(*MESSAGE_FIELDS).order_by('-id')[:window])[::-1]
+    if first_page:
+        buffer.prime(room.id, room.name, rows, len(rows) < window, token)
+    return room.name, rows[-limit:]
+
+
 # Get chat messages for a room
+@cache_control(no_cache=True)
 def get_room_messages(request):
-    """API: Get all messages in a room"""
+    """API: Get messages in a room (all, or the newest ?limit= before ?before_id=)"""
     try:
         room_id = request.GET.get('room_id')
         if not room_id:
             return JsonResponse({'status': 'error', 'message': 'Room ID required'}, status=400)
         
-        room = Room.objects.get(id=room_id)
-        messages = ChatMessage.objects.filter(room=room).values(
-            'id', 'sender_name', 'sender_uid', 'message', 'created_at', 'is_edited'
-        ).order_by('created_at')
+        limit = int(request.GET.get('limit', 0))
+        before_id = int(request.GET.get('before_id', 0))
+        if 'limit' in request.GET and limit < 1:
+            return JsonResponse({'status': 'error', 'message': 'limit must be at least 1'}, status=400)
+        if before_id < 0:
+            return JsonResponse({'status': 'error', 'message': 'before_id must not be negative'}, status=400)
+        room_name, messages = _load_messages(int(room_id), limit, before_id)
+        
+        response = {'status': 'success', 'room': room_name}
+        if limit:
+            response['has_more'] = len(messages) == limit
+        
+        # Opt-in columnar format, see base/wire.py
+        if request.GET.get('format') == COMPACT_FORMAT:
+            response['format'] = COMPACT_FORMAT
+            response['messages'] = pack_messages(messages)
+        else:
+            response['messages'] = messages
         
-        return JsonResponse({
-            'status': 'success',
-            'room': room.name,
-            'messages': list(messages)
-        }, safe=False)
+        return JsonResponse(response, safe=False)
     except Room.DoesNotExist:
         return JsonResponse({'status': 'error', 'message': 'Room not found'}, status=404)
     except Exception as e:
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
+# Recent-message buffer metrics
+def get_buffer_stats(request):
+    """API: Hit rate and memory use of this worker's recent-message buffer"""
+    return JsonResponse({'status': 'success', 'buffer': get_buffer().stats()})
+
+
 # Send chat message
 @csrf_exempt
+@ratelimit('240/m', key='ip', burst=40, scope='send_chat_message_ip_total')
+@ratelimit('60/m', key=('sender_uid', 'room_id'), burst=10)
+@ratelimit('120/m', key=('ip', 'room_id'), burst=20, scope='send_chat_message_ip')
 def send_chat_message(request):
     """API: Send chat message to room"""
     if request.method != 'POST':
@@ -563,6 +777,9 @@ def send_chat_message(request):
             sender_uid=sender_uid,
             message=message
         )
+        get_buffer().append(room.id, _serialize_message(chat_msg))
+        activity.record_message(room.id, chat_msg.created_at)
+        events.publish(room.id, events.MESSAGE_CREATED, **_message_event(chat_msg, *MESSAGE_FIELDS))
         
         return JsonResponse({
             'status': 'success',
@@ -600,6 +817,8 @@ def edit_chat_message(request):
         msg.is_edited = True
         msg.edited_at = timezone.now()
         msg.save()
+        get_buffer().update(msg.room_id, msg.id, message=msg.message, is_edited=True, edited_at=msg.edited_at)
+        events.publish(msg.room_id, events.MESSAGE_EDITED, **_message_event(msg, 'message', 'edited_at'))
         
         return JsonResponse({
             'status': 'success',
@@ -632,7 +851,10 @@ def delete_chat_message(request):
             return JsonResponse({'status': 'error', 'message': 'Message ID required'}, status=400)
         
         msg = ChatMessage.objects.get(id=message_id)
+        room_id = msg.room_id
         msg.delete()
+        get_buffer().remove(room_id, int(message_id))
+        events.publish(room_id, events.MESSAGE_DELETED, id=int(message_id))
         
         return JsonResponse({'status': 'success', 'message': 'Message deleted'})
     except ChatMessage.DoesNotExist:
@@ -641,7 +863,83 @@ def delete_chat_message(request):
         return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
 
 
+# ==================== READ MARKERS & UNREAD COUNTS ====================
+
+# Mark messages as read
+@csrf_exempt
+def mark_read(request):
+    """API: Advance a member's read high-water mark in a room"""
+    if request.method != 'POST':
+        return JsonResponse({'status': 'error', 'message': 'POST method required'}, status=400)
+    
+    try:
+        data = json.loads(request.body)
+        room_id = data.get('room_id')
+        uid = data.get('uid')
+        message_id = data.get('message_id')
+        
+        if not all([room_id, uid, message_id]):
+            return JsonResponse({'status': 'error', 'message': 'Missing required fields'}, status=400)
+        
+        # Markers only move forward; a stale or repeated mark writes nothing.
+        updated = RoomMember.objects.filter(
+            room_id=room_id, uid=uid, last_read_message_id__lt=message_id
+        ).update(last_read_message_id=message_id)
+        
+        if not updated and data.get('name'):
+            # Chat-only readers get an inactive row that only carries the mark:
+            # it doesn't take a seat (max_members) until they actually join.
+            Room.objects.get(id=room_id)
+            RoomMember.objects.get_or_create(
+                room_id=room_id,
+                uid=uid,
+                defaults={'name': data['name'], 'is_active': False, 'last_read_message_id': message_id}
+            )
+        
+        return JsonResponse({'status': 'success', 'message': 'Marked as read'})
+    except Room.DoesNotExist:
+        return JsonResponse({'status': 'error', 'message': 'Room not found'}, status=404)
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
+# Unread counts for all of a member's rooms
+@cache_control(no_cache=True)
+def get_unread_counts(request):
+    """API: Unread message counts for every active room a uid has joined or read (one query)"""
+    try:
+        uid = request.GET.get('uid')
+        if not uid:
+            return JsonResponse({'status': 'error', 'message': 'UID required'}, status=400)
+        
+        # Range count on the (room, id) index above each member's mark
+        unread = ChatMessage.objects.filter(
+            room=OuterRef('room'), id__gt=OuterRef('last_read_message_id')
+        ).exclude(sender_uid=uid).order_by().values('room').annotate(count=Count('id')).values('count')
+        
+        # Any is_active: readers' marker rows (see mark_read) are inactive.
+        rooms = RoomMember.objects.filter(uid=uid, room__is_active=True).annotate(
+            unread=Coalesce(Subquery(unread), 0)
+        ).values('room_id', 'room__name', 'last_read_message_id', 'unread').order_by()
+        
+        return JsonResponse({
+            'status': 'success',
+            'rooms': [
+                {
+                    'room_id': row['room_id'],
+                    'room': row['room__name'],
+                    'last_read_message_id': row['last_read_message_id'],
+                    'unread': row['unread']
+                }
+                for row in rooms
+            ]
+        })
+    except Exception as e:
+        return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+
+
 # Chat room UI
+@cache_control(no_cache=True)
 def chat_room(request, room_id=None):
     """Render chat room UI"""
     try:
@@ -649,6 +947,43 @@ def chat_room(request, room_id=None):
             room = Room.objects.get(id=room_id)
         else:
             room = None
-        return render(request, 'base/chat_room.html', {'room': room})
+        response = render(request, 'base/chat_room.html', {'room': room})
+        if room:
+            response['Last-Modified'] = http_date(room.updated_at.timestamp())
+        return response
     except Room.DoesNotExist:
         return render(request, 'base/room_not_found.html', {'error': 'Room not found'}, status=404)
+
+
+# ==================== REQUEST PROFILES ====================
+
+def _is_staff(request):
+    user = getattr(request, 'user', None)
+    return user is not None and user.is_staff
+
+
+# List recorded profiles
+@cache_control(no_cache=True)
+def list_profiles(request):
+    """API: Newest-first summaries of the profiles in this worker's on-disk ring (staff only)"""
+    if not _is_staff(request):
+        return JsonResponse({'status': 'error', 'message': 'Staff only'}, status=403)
+    return JsonResponse({'status': 'success', 'profiles': profiling.get_store().summaries()})
+
+
+# One recorded profile
+@cache_control(no_cache=True)
+def get_profile(request, profile_id):
+    """API: One profile as JSON, or its collapsed stacks with ?format=collapsed (staff only)"""
+    if not _is_staff(request):
+        return JsonResponse({'status': 'error', 'message': 'Staff only'}, status=403)
+    try:
+        record = profiling.get_store().get(profile_id)
+    except KeyError:
+        return JsonResponse({'status': 'error', 'message': 'Profile not found'}, status=404)
+    
+    if request.GET.get('format') == 'collapsed':
+        if 'stacks' not in record:
+            return JsonResponse({'status': 'error', 'message': 'Not a sampling profile'}, status=400)
+        return HttpResponse(record['stacks'], content_type='text/plain; charset=utf-8')
+    return JsonResponse({'status': 'success', 'profile': record})
@@ -0,0 +1,73 @@
+"""Compact (columnar) wire format for chat history.
+
+The row format repeats every key for every message. The compact format sends
+one array per column, a per-response sender dictionary, and timestamps as
+epoch-millisecond deltas (the first value is absolute). ``edited_at`` is
+absolute epoch milliseconds, or None for messages never edited.
+"""
+
+COMPACT_FORMAT = 'compact'
+
+
+def epoch_ms(value):
+    """Convert an aware datetime to integer epoch milliseconds"""
+    return int(value.timestamp() * 1000)
+
+
+def pack_messages(messages):
+    """Pack message dicts (as returned by ``.values()``) into columns"""
+    senders = []
+    sender_index = {}
+    ids = []
+    sender_col = []
+    text_col = []
+    ts_col = []
+    edited_col = []
+    edited_at_col = []
+
+    previous_ts = 0
+    for msg in messages:
+        key = (msg['sender_name'], msg['sender_uid'])
+        idx = sender_index.get(key)
+        if idx is None:
+            idx = sender_index[key] = len(senders)
+            senders.append([msg['sender_name'], msg['sender_uid']])
+
+        ts = epoch_ms(msg['created_at'])
+        ids.append(msg['id'])
+        sender_col.append(idx)
+        text_col.append(msg['message'])
+        ts_col.append(ts - previous_ts)
+        edited_col.append(1 if msg['is_edited'] else 0)
+        edited_at_col.append(epoch_ms(msg['edited_at']) if msg.get('edited_at') else None)
+        previous_ts = ts
+
+    return {
+        'senders': senders,
+        'id': ids,
+        'sender': sender_col,
+        'message': text_col,
+        'created_at': ts_col,
+        'is_edited': edited_col,
+        'edited_at': edited_at_col,
+    }
+
+
+def unpack_messages(packed):
+    """Inverse of ``pack_messages``; timestamps come back as epoch ms"""
+    senders = packed['senders']
+    messages = []
+    ts = 0
+    for i, msg_id in enumerate(packed['id']):
+        name, uid = senders[packed['sender'][i]]
+        ts += packed['created_at'][i]
+        messages.append({
+            'id': msg_id,
+            'sender_name': name,
+            'sender_uid': uid,
+            'message': packed['message'][i],
+            'created_at': ts,
+            'is_edited': bool(packed['is_edited'][i]),
+            'edited_at': packed['edited_at'][i],
+        })
+    return messages
@@ -46,14 +46,76 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
-    'django.contrib.sessions.middleware.SessionMiddleware',
+    'base.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    'base.fastlane.FastLaneSessionMiddleware',
     'django.middleware.common.CommonMiddleware',
-    'django.middleware.csrf.CsrfViewMiddleware',
-    'django.contrib.auth.middleware.AuthenticationMiddleware',
-    'django.contrib.messages.middleware.MessageMiddleware',
-    'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'base.fastlane.FastLaneCsrfViewMiddleware',
+    'base.fastlane.FastLaneAuthenticationMiddleware',
+    'base.fastlane.FastLaneMessageMiddleware',
+    'base.fastlane.FastLaneXFrameOptionsMiddleware',
+    'base.events.EventBusMiddleware',
+    'base.profiling.ProfilingMiddleware',
 ]
 
+# Polled JSON routes that skip session/auth/messages/CSRF/clickjacking
+# middleware (base/fastlane.py). Views opt back in with @full_stack.
+FAST_LANE_PREFIXES = (
+    '/chat/messages/',
+    '/chat/send/',
+    '/get_member/',
+    '/rooms/by-code/',
+    '/rooms/members/',
+)
+
+# Per-worker ring buffer of the newest messages of hot rooms
+# (base/message_buffer.py). First-page reads of buffered rooms skip the DB.
+CHAT_BUFFER_PER_ROOM = int(os.environ.get('CHAT_BUFFER_PER_ROOM', '100'))
+CHAT_BUFFER_MAX_ROOMS = int(os.environ.get('CHAT_BUFFER_MAX_ROOMS', '1000'))
+CHAT_BUFFER_MAX_BYTES = int(os.environ.get('CHAT_BUFFER_MAX_BYTES', str(32 * 1024 * 1024)))
+
+# Cross-worker room events (base/events.py) that keep the per-worker buffers
+# coherent. 'memory' stays in-process; use 'socket' for several workers on one
+# host and 'postgres' (LISTEN/NOTIFY) for anything spread across machines.
+EVENT_BUS = {
+    'BACKEND': os.environ.get('EVENT_BUS_BACKEND', 'memory'),
+    'SOCKET_DIR': os.environ.get('EVENT_BUS_SOCKET_DIR', '/tmp/streambeat-events'),
+    'CHANNEL': os.environ.get('EVENT_BUS_CHANNEL', 'streambeat_events'),
+    'BATCH_WINDOW_MS': int(os.environ.get('EVENT_BUS_BATCH_WINDOW_MS', '10')),
+    'BATCH_SIZE': int(os.environ.get('EVENT_BUS_BATCH_SIZE', '200')),
+}
+
+# Hourly room activity rollups (base/activity.py) older than this are pruned
+# by `manage.py rollup_activity`.
+ACTIVITY_RETENTION_DAYS = int(os.environ.get('ACTIVITY_RETENTION_DAYS', '90'))
+
+# On-demand request profiling (base/profiling.py). Off means the middleware
+# drops out of the chain. On, it profiles requests with a signed X-Profile
+# header (manage.py profile_token), ?_profile=1 from staff, or a random
+# SAMPLE_RATE share, and keeps the newest MAX_PROFILES under DIR.
+PROFILING = {
+    'ENABLED': os.environ.get('PROFILING_ENABLED', 'False') == 'True',
+    'ENGINE': os.environ.get('PROFILING_ENGINE', 'cprofile'),
+    'SAMPLE_RATE': float(os.environ.get('PROFILING_SAMPLE_RATE', '0')),
+    'SAMPLE_INTERVAL_MS': float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS', '2')),
+    'DIR': os.environ.get('PROFILING_DIR', '/tmp/streambeat-profiles'),
+    'MAX_PROFILES': int(os.environ.get('PROFILING_MAX_PROFILES', '50')),
+}
+
+# Sessions are read from the cache and only written through to the DB.
+SESSION_ENGINE = os.environ.get('SESSION_ENGINE', 'django.contrib.sessions.backends.cached_db')
+
+# Response compression (base.middleware.CompressionMiddleware). Brotli is
+# used when the `brotli` package is installed, otherwise gzip.
+COMPRESSION_MIN_SIZE = int(os.environ.get('COMPRESSION_MIN_SIZE', '512'))  # base.middleware.DEFAULT_MIN_SIZE
+COMPRESSION_BROTLI_QUALITY = int(os.environ.get('COMPRESSION_BROTLI_QUALITY', '5'))
+
+# Token-bucket limits on write/token endpoints (base/throttling.py). Use the
+# 'cache' backend to share buckets across workers via CACHES['default'].
+RATELIMIT_ENABLE = os.environ.get('RATELIMIT_ENABLE', 'True') == 'True'
+RATELIMIT_BACKEND = os.environ.get('RATELIMIT_BACKEND', 'memory')
+RATELIMIT_TRUST_FORWARDED = os.environ.get('RATELIMIT_TRUST_FORWARDED', 'False') == 'True'
+
 ROOT_URLCONF = 'mychat.urls'
 
 TEMPLATES = [
@@ -72,6 +134,14 @@ TEMPLATES = [
     },
 ]
 
+# Backs cached_db sessions and, with RATELIMIT_BACKEND=cache, rate-limit buckets.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'streambeat'),
+    }
+}
+
 WSGI_APPLICATION = 'mychat.wsgi.application'
 
 
@@ -141,6 +211,14 @@ STATICFILES_DIRS = [
     BASE_DIR / 'static'
 ]
 
+# Fingerprinted file names plus precompressed .gz/.br siblings, written by
+# `collectstatic` into STATIC_ROOT (see base/storage.py).
+STATICFILES_STORAGE = 'base.storage.CompressedManifestStaticFilesStorage'
+
+# Serve STATIC_ROOT from Django with far-future caching when no CDN sits in
+# front of the app (see base/staticserve.py).
+SERVE_STATIC = os.environ.get('SERVE_STATIC', 'False') == 'True'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.0/ref/settings/#default-auto-field
 
@@ -0,0 +1,38 @@
+"""
+Slim settings for API-only serverless functions (see mychat/wsgi_api.py).
+
+Everything in mychat.settings, minus the apps and middleware the JSON views
+never touch (admin, sessions, messages, static files, CSRF, clickjacking), so
+a cold start imports and initialises less. Pages and the admin keep using
+mychat.settings.
+"""
+from .settings import *  # noqa: F401,F403
+
+INSTALLED_APPS = [
+    'django.contrib.auth',
+    'django.contrib.contenttypes',
+
+    'base',
+]
+
+MIDDLEWARE = [
+    'django.middleware.security.SecurityMiddleware',
+    'base.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
+    'django.middleware.common.CommonMiddleware',
+    'base.events.EventBusMiddleware',
+    'base.profiling.ProfilingMiddleware',
+]
+
+ROOT_URLCONF = 'mychat.urls_api'
+
+# A copy: the star import shares TEMPLATES (and its dicts) with mychat.settings.
+TEMPLATES = [{
+    **TEMPLATES[0],  # noqa: F405
+    'OPTIONS': {
+        **TEMPLATES[0]['OPTIONS'],  # noqa: F405
+        'context_processors': ['django.template.context_processors.request'],
+    },
+}]
+
+SERVE_STATIC = False
@@ -1,7 +1,13 @@
+from django.conf import settings
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
+
+from base import staticserve
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('', include('base.urls'))
 ]
+
+if settings.SERVE_STATIC:
+    urlpatterns.insert(0, re_path(r'^%s(?P<path>.*)$' % settings.STATIC_URL.lstrip('/'), staticserve.serve))
@@ -0,0 +1,6 @@
+"""URLconf for mychat.settings_api: the base app only, no admin or static files."""
+from django.urls import path, include
+
+urlpatterns = [
+    path('', include('base.urls'))
+]
@@ -0,0 +1,14 @@
+"""
+WSGI entry point for the API-only serverless function.
+
+Same as mychat/wsgi.py but with the slim mychat.settings_api profile; see
+vercel.json for the routes it serves.
+"""
+
+import os
+
+from django.core.wsgi import get_wsgi_application
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'mychat.settings_api')
+
+application = get_wsgi_application()